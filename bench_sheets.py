@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи в Google Sheets на локальном поддельном сервере.
+
+N пользователей одновременно выполняют сценарий бота: несколько визитов,
+на каждом — выгрузка изменённого профиля в лист Users (UsersSheetExporter)
+и запись ответа в журнал диалогов (save_dialog_turn).
+Сеть и квоты имитирует FakeSheetsServer, поэтому реальная таблица не нужна.
+
+Пример:
+    python bench_sheets.py --users 200 --latency 0.15 --quota 300
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в путь
+project_root = str(Path(__file__).parent)
+sys.path.insert(0, project_root)
+
+from tests.fake_sheets import FakeSheetsServer
+from telegram_mantra_bot.bot.models import User
+from telegram_mantra_bot.bot.sheets import DIALOGS_HEADERS, GoogleSheetsClient
+from telegram_mantra_bot.bot.sheets_export import UsersSheetExporter
+from telegram_mantra_bot.bot.sheets_http import AsyncSheetsApi
+
+USERS_HEADERS = ['user_id', 'username', 'first_name', 'last_name', 'started_at', 'last_active', 'ai_result']
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def user_session(client, exporter, telegram_id: int, visits: int, latencies: list):
+    user = User(id=telegram_id, telegram_id=telegram_id, username=f'user{telegram_id}', first_name='Bench',
+                last_name=str(telegram_id), created_at=datetime(2024, 1, 1))
+    for visit in range(1, visits + 1):
+        user.last_active = datetime.now()
+        started = time.perf_counter()
+        await exporter.export_users([user])
+        latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        client.save_dialog_turn(telegram_id, f'bench-{telegram_id}', visit, f'Вопрос {visit}', f'Ответ {visit}')
+        latencies.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='одновременных пользователей')
+    parser.add_argument('--visits', type=int, default=3, help='визитов (выгрузка профиля и ответ в журнал) на пользователя')
+    parser.add_argument('--existing', type=int, default=1000, help='строк в листе Users до старта')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка ответа API, с')
+    parser.add_argument('--jitter', type=float, default=0.05, help='случайная добавка к задержке, с')
+    parser.add_argument('--quota', type=int, default=None, help='квота сервера, запросов в минуту (429 сверх неё)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля случайных 429/503')
+    parser.add_argument('--reads-per-minute', type=int, default=600)
+    parser.add_argument('--writes-per-minute', type=int, default=600)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--flush-max-batch', type=int, default=200)
+    args = parser.parse_args()
+
+    # Половина участников уже есть в таблице, половина — новые
+    rows = [USERS_HEADERS] + [
+        [str(1_000_000 + i), f'old{i}', 'Old', str(i), '2024-01-01 00:00', '2024-01-01 00:00', '']
+        for i in range(args.existing)
+    ]
+    server = FakeSheetsServer(
+        {'Users': rows, 'Dialogs': [DIALOGS_HEADERS]},
+        latency=args.latency,
+        jitter=args.jitter,
+        quota_per_minute=args.quota,
+        error_rate=args.error_rate,
+        seed=42,
+    )
+    api = AsyncSheetsApi(
+        'bench',
+        reads_per_minute=args.reads_per_minute,
+        writes_per_minute=args.writes_per_minute,
+        backoff_base=0.2,
+        transport=server.transport(),
+    )
+    client = GoogleSheetsClient(
+        flush_interval=args.flush_interval,
+        flush_max_batch=args.flush_max_batch,
+        api=api,
+    )
+    exporter = UsersSheetExporter(client)
+    await client.users_index.ensure_loaded()
+    writer = asyncio.create_task(client.write_queue.run())
+
+    user_ids = [
+        1_000_000 + i if i % 2 == 0 and i < args.existing else 2_000_000 + i
+        for i in range(args.users)
+    ]
+    latencies: list = []
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(client, exporter, uid, args.visits, latencies) for uid in user_ids))
+    handlers_done = time.perf_counter() - started
+
+    # Ждём, пока очередь выгрузит всё в «таблицу»
+    client.write_queue.stop()
+    await writer
+    total = time.perf_counter() - started
+    await api.aclose()
+
+    actions = len(latencies)
+    print(f"Пользователей: {args.users}, действий: {actions}")
+    print(f"Хендлеры завершились за {handlers_done:.2f}с, выгрузка завершена за {total:.2f}с")
+    print(f"Пропускная способность: {actions / total:.1f} действий/с")
+    print(f"Задержка действия: p50={percentile(latencies, 50) * 1000:.1f}мс "
+          f"p99={percentile(latencies, 99) * 1000:.1f}мс "
+          f"mean={statistics.mean(latencies) * 1000:.1f}мс")
+    print(f"Запросов к API: {server.total_calls} ({server.total_calls / actions:.3f} на действие) {dict(server.calls)}")
+    print(f"Ответов с ошибкой: {dict(server.errors)}, повторов клиента: {api.metrics['retries']}")
+    print(f"Строк в листе Users: {len(server.read('Users')) - 1}, в журнале Dialogs: {len(server.read('Dialogs')) - 1}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк стоимости импорта модулей бота.
+
+Каждый импорт выполняется в отдельном свежем процессе (иначе сработал бы
+кэш sys.modules), из временной директории — чтобы заметить побочные
+эффекты вроде созданного при импорте файла БД.
+
+Пример:
+    python bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+project_root = str(Path(__file__).parent)
+
+TARGETS = [
+    ('config', 'import telegram_mantra_bot.bot.config'),
+    ('models', 'import telegram_mantra_bot.bot.models'),
+    ('alembic metadata', 'from telegram_mantra_bot.bot.models import Base; Base.metadata.tables'),
+    ('messages', 'import telegram_mantra_bot.bot.messages'),
+    ('handlers.socratic', 'import telegram_mantra_bot.bot.handlers.socratic'),
+    ('models.init()', 'import telegram_mantra_bot.bot.models as m; getattr(m, "init", lambda: None)()'),
+]
+
+PROBE = '''
+import json, logging, os, sys, time
+logging.basicConfig(level=logging.INFO, stream=open(os.devnull, 'w'))
+records = []
+logging.getLogger().addHandler(type('H', (logging.Handler,), {{'emit': lambda self, r: records.append(r)}})())
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'ms': elapsed * 1000, 'log_records': len(records), 'files': sorted(os.listdir('.'))}}))
+'''
+
+
+def measure(code: str, runs: int):
+    samples, logs, files = [], 0, set()
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONPATH=project_root, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bot.db')}")
+            out = subprocess.run(
+                [sys.executable, '-c', PROBE.format(code=code)],
+                cwd=tmp, env=env, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(out)
+            samples.append(result['ms'])
+            logs = max(logs, result['log_records'])
+            files.update(result['files'])
+    return statistics.median(samples), min(samples), logs, sorted(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='запусков на каждый импорт')
+    args = parser.parse_args()
+
+    print(f"{'импорт':<20} {'медиана, мс':>12} {'мин, мс':>9} {'логов':>6}  файлы после импорта")
+    for name, code in TARGETS:
+        median, best, logs, files = measure(code, args.runs)
+        print(f"{name:<20} {median:>12.1f} {best:>9.1f} {logs:>6}  {', '.join(files) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import sys
 import os
+import asyncio
 from pathlib import Path
 
 # Добавляем корневую директорию проекта в путь
@@ -10,7 +11,7 @@ sys.path.insert(0, project_root)
 from dotenv import load_dotenv
 load_dotenv()
 
-def main():
+async def main():
     print("🔍 Детальная отладка Google Sheets")
     print("=" * 50)
     
@@ -49,7 +50,7 @@ def main():
             # 4. Пробуем получить сообщения
             print("\n4. Попытка получения сообщений:")
             if sheets_client:
-                messages = sheets_client.get_all_messages()
+                messages = await sheets_client.get_all_messages()
                 print(f"  📊 Получено сообщений: {len(messages)}")
                 if messages:
                     print("  📝 Ключи сообщений:")
@@ -79,4 +80,4 @@ def main():
     print("\n🎯 Отладка завершена!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
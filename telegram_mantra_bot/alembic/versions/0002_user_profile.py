@@ -0,0 +1,30 @@
+"""User profile fields and export watermark"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('first_name', sa.String(100)))
+    op.add_column('users', sa.Column('last_name', sa.String(100)))
+    op.add_column('users', sa.Column('last_active', sa.TIMESTAMP))
+    op.add_column('users', sa.Column('ai_result', sa.Text))
+    # SQLite не умеет добавлять колонку с непостоянным DEFAULT в непустую таблицу:
+    # добавляем без умолчания и заполняем существующие строки (новые заполняет ORM)
+    op.add_column('users', sa.Column('updated_at', sa.TIMESTAMP))
+    op.execute("UPDATE users SET updated_at = CURRENT_TIMESTAMP")
+    op.create_index('ix_users_updated_at', 'users', ['updated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_updated_at', table_name='users')
+    op.drop_column('users', 'updated_at')
+    op.drop_column('users', 'ai_result')
+    op.drop_column('users', 'last_active')
+    op.drop_column('users', 'last_name')
+    op.drop_column('users', 'first_name')
@@ -0,0 +1,29 @@
+"""Composite index for keyset pagination of mantras"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 0001 predates the owner/creation columns the models use; add them if missing
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('mantras')}
+    if 'user_id' not in columns:
+        op.add_column('mantras', sa.Column('user_id', sa.Integer))
+    if 'created_at' not in columns:
+        op.add_column('mantras', sa.Column('created_at', sa.TIMESTAMP))
+    op.create_index('ix_mantras_user_id_created_at_id', 'mantras', ['user_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_mantras_user_id_created_at_id', table_name='mantras')
+    # Revision 0002 has no such columns: drop whatever the upgrade had to add,
+    # so that upgrading again leaves the same schema
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('mantras')}
+    for name in ('created_at', 'user_id'):
+        if name in columns:
+            op.drop_column('mantras', name)
@@ -0,0 +1,19 @@
+"""Reminder leases and due-reminder index"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('reminders', sa.Column('claimed_at', sa.TIMESTAMP))
+    op.create_index('ix_reminders_sent_remind_at', 'reminders', ['sent', 'remind_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reminders_sent_remind_at', table_name='reminders')
+    op.drop_column('reminders', 'claimed_at')
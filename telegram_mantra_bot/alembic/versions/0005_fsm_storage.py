@@ -0,0 +1,25 @@
+"""Shared FSM storage"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'fsm_storage',
+        sa.Column('key', sa.String(255), primary_key=True),
+        sa.Column('state', sa.String(255)),
+        sa.Column('data', sa.Text),
+        sa.Column('expires_at', sa.TIMESTAMP)
+    )
+    op.create_index('ix_fsm_storage_expires_at', 'fsm_storage', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fsm_storage_expires_at', table_name='fsm_storage')
+    op.drop_table('fsm_storage')
@@ -0,0 +1,29 @@
+"""Dialog turns in topics/answers"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Колонки без DEFAULT(now()): SQLite не добавит такую в непустую таблицу.
+    # Существующие строки заполняем отдельно, новые заполняет ORM
+    op.add_column('topics', sa.Column('created_at', sa.TIMESTAMP))
+    op.add_column('answers', sa.Column('question_text', sa.Text))
+    op.add_column('answers', sa.Column('created_at', sa.TIMESTAMP))
+    op.execute("UPDATE topics SET created_at = CURRENT_TIMESTAMP")
+    op.execute("UPDATE answers SET created_at = CURRENT_TIMESTAMP")
+    op.create_index('ix_topics_user_id', 'topics', ['user_id'])
+    op.create_index('ix_answers_topic_id_question_index', 'answers', ['topic_id', 'question_index'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_answers_topic_id_question_index', table_name='answers')
+    op.drop_index('ix_topics_user_id', table_name='topics')
+    op.drop_column('answers', 'created_at')
+    op.drop_column('answers', 'question_text')
+    op.drop_column('topics', 'created_at')
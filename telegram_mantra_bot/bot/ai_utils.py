@@ -1,64 +1,100 @@
-import openai
-import asyncio
 from .config import load_config
+from .llm import get_llm_client
+from .mantra_cache import char_ngrams, normalize
 
-async def generate_socratic_questions_openrouter(block, description, openrouter_api_key, num_questions=6):
+SOCRATIC_SYSTEM_PROMPT = "Ты — полезный ассистент, задаёшь вопросы для психологической саморефлексии."
+
+async def generate_socratic_questions_openrouter(block, description, openrouter_api_key=None, num_questions=6):
     config = load_config()
-    openai.api_key = openrouter_api_key
-    openai.api_base = "https://openrouter.ai/api/v1"
-    model_name = "mistralai/mixtral-8x7b-instruct"
     prompt = config.socratic_prompt.format(
         num_questions=num_questions,
         block=block,
         description=description
     )
-    loop = asyncio.get_running_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: openai.ChatCompletion.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "Ты — полезный ассистент, задаёшь вопросы для психологической саморефлексии."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=400,
-        )
+    questions_text = await get_llm_client().complete(
+        [
+            {"role": "system", "content": SOCRATIC_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=400,
+        api_key=openrouter_api_key,
     )
-    questions_text = response["choices"][0]["message"]["content"]
+    return parse_questions(questions_text, num_questions)
+
+def parse_questions(questions_text, num_questions):
+    """Список вопросов из ответа модели: по одному на строку, без нумерации и маркеров"""
     questions = [q.strip("-—. 1234567890) ") for q in questions_text.split('\n') if q.strip()]
     return [q for q in questions if q][:num_questions]
 
-async def generate_next_socratic_question_openrouter(user_request, history, openrouter_api_key):
-    """
-    user_request: str — исходный запрос пользователя
-    history: list of (question, answer) tuples
-    Возвращает следующий вопрос (str)
-    """
-    config = load_config()
-    openai.api_key = openrouter_api_key
-    openai.api_base = "https://openrouter.ai/api/v1"
-    model_name = "mistralai/mixtral-8x7b-instruct"
-    # Формируем историю
+def format_history(history):
     history_text = ""
     for idx, (q, a) in enumerate(history, 1):
         history_text += f"Вопрос {idx}: {q}\nОтвет {idx}: {a}\n"
+    return history_text
+
+async def plan_socratic_questions_openrouter(user_request, history, num_questions, openrouter_api_key=None):
+    """
+    План диалога: сразу ``num_questions`` следующих вопросов одним запросом.
+    Возвращает список вопросов (может оказаться короче запрошенного).
+    """
     prompt = (
-        f"Ты — полезный ассистент, задаёшь вопросы для психологической саморефлексии.\n"
         f"Исходный запрос пользователя: {user_request}\n"
-        f"История диалога:\n{history_text}"
+        f"История диалога:\n{format_history(history)}"
+        f"Сформулируй {num_questions} следующих сократических вопросов для пользователя. "
+        f"Вопросы должны идти по порядку и углублять саморефлексию, каждый вопрос с новой строки. "
+        f"Только список вопросов, ничего лишнего."
+    )
+    questions_text = await get_llm_client().complete(
+        [
+            {"role": "system", "content": SOCRATIC_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=100 + 80 * num_questions,
+        api_key=openrouter_api_key,
+    )
+    return parse_questions(questions_text, num_questions)
+
+def answer_divergence(answer, context):
+    """
+    Насколько ответ ушёл от плана: доля символьных триграмм ответа, которых
+    нет ни в исходном запросе, ни в заданном и запланированных вопросах.
+    0 — ответ целиком в русле диалога, 1 — ничего общего.
+    """
+    answer_grams = char_ngrams(normalize(answer))
+    context_grams = set()
+    for text in context:
+        context_grams |= char_ngrams(normalize(text or ""))
+    return 1 - len(answer_grams & context_grams) / len(answer_grams)
+
+def next_socratic_question_messages(user_request, history):
+    """Сообщения запроса следующего вопроса по исходному запросу и истории диалога"""
+    prompt = (
+        f"{SOCRATIC_SYSTEM_PROMPT}\n"
+        f"Исходный запрос пользователя: {user_request}\n"
+        f"История диалога:\n{format_history(history)}"
         f"Сформулируй следующий сократический вопрос для пользователя. Только вопрос, без пояснений."
     )
-    loop = asyncio.get_running_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: openai.ChatCompletion.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "Ты — полезный ассистент, задаёшь вопросы для психологической саморефлексии."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=200,
-        )
+    return [
+        {"role": "system", "content": SOCRATIC_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+async def generate_next_socratic_question_openrouter(user_request, history, openrouter_api_key=None):
+    """
+    user_request: str — исходный запрос пользователя
+    history: list of (question, answer) tuples
+    Возвращает следующий вопрос (str)
+    """
+    return await get_llm_client().complete(
+        next_socratic_question_messages(user_request, history),
+        max_tokens=200,
+        api_key=openrouter_api_key,
+    )
+
+def stream_next_socratic_question_openrouter(user_request, history, openrouter_api_key=None):
+    """То же, что generate_next_socratic_question_openrouter, но фрагментами по мере генерации"""
+    return get_llm_client().stream(
+        next_socratic_question_messages(user_request, history),
+        max_tokens=200,
+        api_key=openrouter_api_key,
     )
-    question = response["choices"][0]["message"]["content"].strip()
-    return question 
\ No newline at end of file
@@ -33,6 +33,62 @@ class Config:
     socratic_prompt: str = ""
     mantra_prompt: str = ""
     parse_mode: str = "HTML"
+    sheets_flush_interval: float = 2.0
+    sheets_flush_max_batch: int = 200
+    sheets_index_revalidate_interval: float = 300.0
+    sheets_timeout: float = 15.0
+    sheets_max_connections: int = 20
+    sheets_reads_per_minute: int = 60
+    sheets_writes_per_minute: int = 60
+    sheets_max_retries: int = 5
+    messages_refresh_interval: float = 300.0
+    messages_snapshot_path: str = "messages_snapshot.json"
+    sheets_export_interval: float = 30.0
+    sheets_export_batch: int = 500
+    sheets_export_lag: float = 60.0
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456
+    user_id_cache_size: int = 10000
+    reminders_batch_size: int = 500
+    reminders_window_seconds: float = 900.0
+    reminders_refill_interval: float = 300.0
+    reminders_lease_seconds: float = 300.0
+    reminders_send_concurrency: int = 20
+    telegram_messages_per_second: float = 25.0
+    fsm_storage: str = "sql"
+    fsm_ttl: float = 604800.0
+    retention_interval: float = 86400.0
+    retention_chunk_size: int = 500
+    retention_chunk_pause: float = 0.2
+    retention_archive_dir: str = "archive"
+    retention_reminders_days: float = 30.0
+    retention_dialogs_days: float = 180.0
+    retention_audio_orders_days: float = 0.0
+    retention_mantras_days: float = 0.0
+    llm_base_url: str = "https://openrouter.ai/api/v1"
+    llm_timeout: float = 60.0
+    llm_connect_timeout: float = 10.0
+    llm_max_connections: int = 50
+    llm_max_retries: int = 2
+    llm_http_referer: str = "https://github.com/your-repo/telegram-mantra-bot"
+    llm_streaming: bool = True
+    llm_stream_edit_interval: float = 1.0
+    mantra_cache_size: int = 1000
+    mantra_cache_ttl: float = 86400.0
+    mantra_cache_threshold: float = 0.6
+    mantra_cache_variants: int = 3
+    socratic_plan_mode: bool = True
+    socratic_replan_divergence: float = 0.8
+    socratic_max_replans: int = 1
+    llm_max_concurrent: int = 8
+    llm_max_queue: int = 200
 
 def load_config() -> Config:
     """Load configuration from environment variables."""
@@ -46,6 +102,62 @@ def load_config() -> Config:
         google_sheets_id=os.getenv("GOOGLE_SHEETS_ID"),
         google_credentials_path=os.getenv("GOOGLE_CREDENTIALS_PATH", "google_credentials.json"),
         parse_mode=os.getenv("PARSE_MODE", "HTML"),
+        sheets_flush_interval=float(os.getenv("SHEETS_FLUSH_INTERVAL", 2.0)),
+        sheets_flush_max_batch=int(os.getenv("SHEETS_FLUSH_MAX_BATCH", 200)),
+        sheets_index_revalidate_interval=float(os.getenv("SHEETS_INDEX_REVALIDATE_INTERVAL", 300)),
+        sheets_timeout=float(os.getenv("SHEETS_TIMEOUT", 15)),
+        sheets_max_connections=int(os.getenv("SHEETS_MAX_CONNECTIONS", 20)),
+        sheets_reads_per_minute=int(os.getenv("SHEETS_READS_PER_MINUTE", 60)),
+        sheets_writes_per_minute=int(os.getenv("SHEETS_WRITES_PER_MINUTE", 60)),
+        sheets_max_retries=int(os.getenv("SHEETS_MAX_RETRIES", 5)),
+        messages_refresh_interval=float(os.getenv("MESSAGES_REFRESH_INTERVAL", 300)),
+        messages_snapshot_path=os.getenv("MESSAGES_SNAPSHOT_PATH", "messages_snapshot.json"),
+        sheets_export_interval=float(os.getenv("SHEETS_EXPORT_INTERVAL", 30)),
+        sheets_export_batch=int(os.getenv("SHEETS_EXPORT_BATCH", 500)),
+        sheets_export_lag=float(os.getenv("SHEETS_EXPORT_LAG", 60)),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        db_pool_pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", 268435456)),
+        user_id_cache_size=int(os.getenv("USER_ID_CACHE_SIZE", 10000)),
+        reminders_batch_size=int(os.getenv("REMINDERS_BATCH_SIZE", 500)),
+        reminders_window_seconds=float(os.getenv("REMINDERS_WINDOW_SECONDS", 900)),
+        reminders_refill_interval=float(os.getenv("REMINDERS_REFILL_INTERVAL", 300)),
+        reminders_lease_seconds=float(os.getenv("REMINDERS_LEASE_SECONDS", 300)),
+        reminders_send_concurrency=int(os.getenv("REMINDERS_SEND_CONCURRENCY", 20)),
+        telegram_messages_per_second=float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", 25)),
+        fsm_storage=os.getenv("FSM_STORAGE", "sql"),
+        fsm_ttl=float(os.getenv("FSM_TTL", 604800)),
+        retention_interval=float(os.getenv("RETENTION_INTERVAL", 86400)),
+        retention_chunk_size=int(os.getenv("RETENTION_CHUNK_SIZE", 500)),
+        retention_chunk_pause=float(os.getenv("RETENTION_CHUNK_PAUSE", 0.2)),
+        retention_archive_dir=os.getenv("RETENTION_ARCHIVE_DIR", "archive"),
+        retention_reminders_days=float(os.getenv("RETENTION_REMINDERS_DAYS", 30)),
+        retention_dialogs_days=float(os.getenv("RETENTION_DIALOGS_DAYS", 180)),
+        retention_audio_orders_days=float(os.getenv("RETENTION_AUDIO_ORDERS_DAYS", 0)),
+        retention_mantras_days=float(os.getenv("RETENTION_MANTRAS_DAYS", 0)),
+        llm_base_url=os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1"),
+        llm_timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+        llm_connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", 10)),
+        llm_max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", 50)),
+        llm_max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+        llm_http_referer=os.getenv("LLM_HTTP_REFERER", "https://github.com/your-repo/telegram-mantra-bot"),
+        llm_streaming=os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes"),
+        llm_stream_edit_interval=float(os.getenv("LLM_STREAM_EDIT_INTERVAL", 1.0)),
+        mantra_cache_size=int(os.getenv("MANTRA_CACHE_SIZE", 1000)),
+        mantra_cache_ttl=float(os.getenv("MANTRA_CACHE_TTL", 86400)),
+        mantra_cache_threshold=float(os.getenv("MANTRA_CACHE_THRESHOLD", 0.6)),
+        mantra_cache_variants=int(os.getenv("MANTRA_CACHE_VARIANTS", 3)),
+        socratic_plan_mode=os.getenv("SOCRATIC_PLAN_MODE", "true").lower() in ("1", "true", "yes"),
+        socratic_replan_divergence=float(os.getenv("SOCRATIC_REPLAN_DIVERGENCE", 0.8)),
+        socratic_max_replans=int(os.getenv("SOCRATIC_MAX_REPLANS", 1)),
+        llm_max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", 8)),
+        llm_max_queue=int(os.getenv("LLM_MAX_QUEUE", 200)),
         socratic_prompt=os.getenv("SOCRATIC_PROMPT", "Сформулируй {num_questions} персональных сократических вопросов для пользователя, который выбрал блок '{block}' и описал своё состояние так: '{description}'. Вопросы должны идти по порядку, каждый вопрос с новой строки. Только список вопросов, ничего лишнего."),
         mantra_prompt=os.getenv("MANTRA_PROMPT", "Создай персональную мантру на основе запроса пользователя. Мантра должна быть краткой, позитивной и направленной на трансформацию. Запрос пользователя: {request}")
     )
@@ -0,0 +1,126 @@
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+
+from .models import FSMRecord, SessionLocal, conflict_insert
+
+logger = logging.getLogger(__name__)
+
+
+def storage_key(key: StorageKey) -> str:
+    """Строковый ключ записи: bot:chat:user[:thread]:destiny"""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id is not None:
+        parts.append(str(key.thread_id))
+    parts.append(key.destiny)
+    return ':'.join(parts)
+
+
+def dumps(data: Dict[str, Any]) -> Optional[str]:
+    """Компактный JSON: без пробелов и \\u-экранирования кириллицы"""
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram в таблице ``fsm_storage`` основной БД.
+
+    Состояние и данные диалога переживают перезапуск и общие для всех
+    воркеров бота. Каждая запись живёт ``ttl`` секунд с последнего
+    изменения (0 — бессрочно): просроченные записи не читаются и
+    периодически удаляются. Запись — один upsert без предварительного чтения.
+    """
+
+    def __init__(self, ttl: float = 7 * 24 * 3600, purge_interval: float = 3600.0):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._next_purge = time.monotonic() + purge_interval
+
+    def _expires_at(self) -> Optional[datetime]:
+        return datetime.utcnow() + timedelta(seconds=self.ttl) if self.ttl else None
+
+    async def _read(self, key: StorageKey) -> Optional[FSMRecord]:
+        async with SessionLocal() as session:
+            record = await session.get(FSMRecord, storage_key(key))
+        if record is None or (record.expires_at is not None and record.expires_at <= datetime.utcnow()):
+            return None
+        return record
+
+    async def _write(self, key: StorageKey, **values):
+        """Upsert одной колонки (state или data); пустая запись удаляется"""
+        row_key = storage_key(key)
+        values['expires_at'] = self._expires_at()
+        async with SessionLocal() as session:
+            insert = conflict_insert(session.bind.dialect.name)
+            if insert is not None:
+                await session.execute(
+                    insert(FSMRecord)
+                    .values(key=row_key, **values)
+                    .on_conflict_do_update(index_elements=[FSMRecord.key], set_=values)
+                )
+            else:
+                record = await session.get(FSMRecord, row_key) or FSMRecord(key=row_key)
+                for column, value in values.items():
+                    setattr(record, column, value)
+                session.add(record)
+            # Ни состояния, ни данных — запись больше не нужна
+            await session.execute(
+                delete(FSMRecord).where(
+                    FSMRecord.key == row_key,
+                    FSMRecord.state == None,
+                    FSMRecord.data == None,
+                )
+            )
+            await session.commit()
+        if time.monotonic() >= self._next_purge:
+            await self.purge_expired()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._read(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._write(key, data=dumps(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._read(key)
+        if record is None or not record.data:
+            return {}
+        return json.loads(record.data)
+
+    async def purge_expired(self) -> int:
+        """Удаляет просроченные записи. Возвращает их количество."""
+        self._next_purge = time.monotonic() + self.purge_interval
+        async with SessionLocal() as session:
+            result = await session.execute(
+                delete(FSMRecord).where(FSMRecord.expires_at <= datetime.utcnow())
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"FSM: удалено просроченных записей: {result.rowcount}")
+        return result.rowcount
+
+    async def close(self) -> None:
+        # Соединениями владеет общий движок models, его закрывает main
+        pass
+
+
+def create_fsm_storage(kind: str = 'sql', ttl: float = 7 * 24 * 3600) -> BaseStorage:
+    """FSM-хранилище по имени из конфигурации: ``sql`` или ``memory``"""
+    if kind == 'memory':
+        from aiogram.fsm.storage.memory import MemoryStorage
+        return MemoryStorage()
+    if kind != 'sql':
+        logger.warning(f"Неизвестный тип FSM-хранилища '{kind}', используем sql")
+    return SQLStorage(ttl=ttl)
@@ -7,7 +7,10 @@ from datetime import datetime, timedelta
 from ..config import load_config
 from ..models import save_mantra
 from ..keyboards import main_menu_keyboard
-import openai
+from ..llm import get_llm_client
+from ..live_message import stream_to_message
+from ..mantra_cache import get_mantra_cache
+from ..llm_scheduler import LLMBusyError, LLMOverloadedError, llm_error_message, llm_slot
 import logging
 from dotenv import load_dotenv
 import tempfile, os, subprocess, speech_recognition as sr
@@ -18,11 +21,6 @@ load_dotenv()
 # Настраиваем логгер для этого модуля
 logger = logging.getLogger(__name__)
 
-# Настраиваем OpenRouter API
-openai.api_base = "https://openrouter.ai/api/v1"
-openai.api_key = load_config().openrouter_api_key
-AI_MODEL = load_config().ai_model
-
 router = Router()
 
 class MantraCreationStates(StatesGroup):
@@ -115,10 +113,14 @@ async def handle_voice_request(message: types.Message, state: FSMContext):
                 logger.error(f'[VOICE] Ошибка сервиса распознавания для пользователя {message.from_user.id}: {str(e)}')
                 await message.answer('Ошибка сервиса распознавания. Пожалуйста, попробуйте позже или отправьте текстовое сообщение.')
 
-async def generate_mantra(message: types.Message, state_data: dict):
-    """Генерация персональной мантры"""
+async def generate_mantra(message: types.Message, state_data: dict, user_id: int = None):
+    """
+    Генерация персональной мантры. ``user_id`` — пользователь, для которого
+    генерируем; по умолчанию автор ``message`` (для callback-кнопок автор — бот).
+    """
     logger.info("Начинаем генерацию мантры")
     config = load_config()
+    user_id = user_id or message.from_user.id
     try:
         # Формируем промпт в зависимости от типа входных данных
         if "request" in state_data:
@@ -129,30 +131,56 @@ async def generate_mantra(message: types.Message, state_data: dict):
                 "Мантра должна быть краткой, позитивной и помогать трансформировать текущее состояние. "
                 f"Описание чувств: {state_data['feelings']}"
             )
-        resp = openai.ChatCompletion.create(
-            model=AI_MODEL,
-            messages=[
-                {"role": "system", "content": "Ты — эксперт по созданию персональных мантр, которые помогают людям трансформировать их состояние."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            headers={"HTTP-Referer": "https://github.com/your-repo/telegram-mantra-bot"}
-        )
-        logger.info("Получен ответ от OpenRouter API")
-        mantra_text = resp.choices[0].message.content.strip()
+        messages = [
+            {"role": "system", "content": "Ты — эксперт по созданию персональных мантр, которые помогают людям трансформировать их состояние."},
+            {"role": "user", "content": prompt}
+        ]
+        header = "✨ Вот ваша персональная мантра:\n\n"
+        # Похожий запрос уже был — отвечаем из кэша без обращения к модели
+        kind = "request" if "request" in state_data else "feelings"
+        cache = get_mantra_cache()
+        mantra_text = cache.get(state_data[kind], kind=kind)
+        from_cache = bool(mantra_text)
+        streamed = False
+        if from_cache:
+            logger.info("Мантра взята из кэша похожих запросов")
+        else:
+            # Генерация ждёт свободный слот: общий лимит бота и одна генерация на пользователя
+            async with llm_slot(message, user_id):
+                if config.llm_streaming:
+                    # Пользователь видит мантру по мере генерации, а не после её окончания
+                    mantra_text = await stream_to_message(
+                        message,
+                        get_llm_client().stream(messages, model=config.ai_model, max_tokens=500),
+                        prefix=header,
+                        interval=config.llm_stream_edit_interval
+                    )
+                    streamed = True
+                else:
+                    mantra_text = await get_llm_client().complete(messages, model=config.ai_model, max_tokens=500)
+        if not from_cache:
+            logger.info("Получен ответ от OpenRouter API")
+            cache.put(state_data[kind], mantra_text, kind=kind)
         logger.info(f"Сгенерирована мантра: {mantra_text}")
         
         # Сохраняем мантру
-        mantra = save_mantra(message.from_user.id, mantra_text)
+        mantra = await save_mantra(user_id, mantra_text)
         logger.info(f"Мантра сохранена в БД с id={mantra.id}")
         
-        # Отправляем пользователю текст мантры
-        await message.answer(
-            f"✨ Вот ваша персональная мантра:\n\n{mantra_text}",
-            reply_markup=main_menu_keyboard()
-        )
+        # Отправляем пользователю текст мантры (в потоковом режиме он уже в чате)
+        if not streamed:
+            await message.answer(
+                f"{header}{mantra_text}",
+                reply_markup=main_menu_keyboard()
+            )
+        else:
+            # Правкой сообщения обычное меню не поставить — возвращаем его отдельным сообщением
+            await message.answer("Мантра сохранена 🙏", reply_markup=main_menu_keyboard())
         logger.info("Мантра отправлена пользователю")
             
+    except (LLMBusyError, LLMOverloadedError) as e:
+        logger.warning(f"Генерация мантры для {user_id} отклонена: {e}")
+        await message.answer(llm_error_message(e))
     except Exception as e:
         logger.error(f"Ошибка при генерации мантры: {str(e)}")
         await message.answer("Произошла ошибка при генерации мантры. Пожалуйста, попробуйте позже.")
@@ -163,4 +191,4 @@ async def generate_mantra_handler(query: types.CallbackQuery, state: FSMContext)
     Обработчик для генерации мантры через callback query
     """
     logger.info("Получен callback query для генерации мантры")
-    await generate_mantra(query.message, await state.get_data())
+    await generate_mantra(query.message, await state.get_data(), user_id=query.from_user.id)
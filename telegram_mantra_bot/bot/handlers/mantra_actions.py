@@ -1,6 +1,7 @@
 from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from ..keyboards import main_menu_keyboard
+from ..keyboards import main_menu_keyboard, my_mantras_keyboard, parse_mantras_page_callback, MANTRAS_PAGE_PREFIX
+from ..models import get_user_mantras_page
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,4 +15,40 @@ async def return_to_main(callback: types.CallbackQuery):
         "Выберите действие:",
         reply_markup=main_menu_keyboard()
     )
-    await callback.message.delete() 
\ No newline at end of file
+    await callback.message.delete() 
+
+async def show_mantras_page(callback: types.CallbackQuery, after=None, before=None):
+    """Показать одну страницу мантр пользователя"""
+    rows, prev_cursor, next_cursor = await get_user_mantras_page(callback.from_user.id, after=after, before=before)
+    if not rows and (after or before):
+        # Страница опустела (мантры удалили) — начинаем с первой
+        rows, prev_cursor, next_cursor = await get_user_mantras_page(callback.from_user.id)
+    if not rows:
+        await callback.message.edit_text("У вас пока нет мантр.", reply_markup=my_mantras_keyboard([]))
+        return
+    mantras = [{'id': mantra_id, 'text': text} for mantra_id, text, _ in rows]
+    await callback.message.edit_text(
+        "Ваши мантры:",
+        reply_markup=my_mantras_keyboard(mantras, prev_cursor=prev_cursor, next_cursor=next_cursor)
+    )
+
+@router.callback_query(F.data == "back_to_mantras")
+async def return_to_mantras(callback: types.CallbackQuery):
+    """Вернуться к списку мантр (первая страница)"""
+    await show_mantras_page(callback)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith(MANTRAS_PAGE_PREFIX))
+async def turn_mantras_page(callback: types.CallbackQuery):
+    """Листание списка мантр"""
+    try:
+        direction, cursor = parse_mantras_page_callback(callback.data)
+    except ValueError:
+        logger.warning(f"Некорректный колбэк страницы мантр: {callback.data}")
+        await callback.answer()
+        return
+    if direction == "p":
+        await show_mantras_page(callback, before=cursor)
+    else:
+        await show_mantras_page(callback, after=cursor)
+    await callback.answer()
@@ -14,18 +14,8 @@ class ReminderStates(StatesGroup):
     waiting_for_time = State()
 
 
-def schedule_reminder(db, user_id: int, mantra_id: int, remind_at):
-    """
-    Создать запись напоминания в базе данных.
-    """
-    reminder = Reminder(
-        user_id=user_id,
-        mantra_id=mantra_id,
-        remind_at=remind_at,
-        sent=False
-    )
-    db.add(reminder)
-    db.commit()
+# Создание напоминаний в боте пока не реализовано: записи добавляются через
+# models.schedule_reminder вне хендлеров, бот только рассылает их (reminder_dispatcher)
 
 
 @router.callback_query(F.data == "next_step")
@@ -2,11 +2,19 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from ..config import load_config
-import openai
 import asyncio
-from ..ai_utils import generate_next_socratic_question_openrouter
+import uuid
+from ..ai_utils import (
+    answer_divergence,
+    generate_next_socratic_question_openrouter,
+    plan_socratic_questions_openrouter,
+    stream_next_socratic_question_openrouter,
+)
+from ..live_message import stream_to_message
+from ..llm_scheduler import LLMBusyError, LLMOverloadedError, llm_error_message, llm_slot
 import logging, tempfile, os, subprocess, speech_recognition as sr
-from ..sheets import get_message, save_questions_block, save_ai_result
+from ..sheets import save_dialog_turn
+from ..models import add_answer, create_topic, get_topic_history, save_user_ai_result
 from ..messages import get_message as get_local_message
 
 # Настраиваем логгер для этого модуля
@@ -30,55 +38,95 @@ REQUIRED_MESSAGES = {
     "socratic_timeout": "Сообщение при истечении времени ожидания ответа"
 }
 
-# Загружаем и логируем все сообщения из Google Sheets
-logger.info("=== Загрузка переменных из Google Sheets ===")
-logger.info(f"Попытка загрузить {len(REQUIRED_MESSAGES)} переменных для сократического диалога")
-
-# Словарь для хранения загруженных значений
-loaded_messages = {}
-missing_messages = []
-
-for msg_key, description in REQUIRED_MESSAGES.items():
-    value = get_local_message(msg_key)
-    if value:
-        loaded_messages[msg_key] = value
-        logger.info(f"✓ {msg_key} ({description}):")
-        logger.info(f"  Значение: {value[:100]}..." if len(value) > 100 else f"  Значение: {value}")
-    else:
-        missing_messages.append(msg_key)
-        logger.warning(f"✗ {msg_key} ({description}): не найдено в таблице")
-
-# Итоговая статистика
-logger.info("=== Итоги загрузки переменных ===")
-logger.info(f"Успешно загружено: {len(loaded_messages)} из {len(REQUIRED_MESSAGES)}")
-if missing_messages:
-    logger.warning("Отсутствующие переменные:")
-    for key in missing_messages:
-        logger.warning(f"  - {key} ({REQUIRED_MESSAGES[key]})")
+def log_required_messages() -> list:
+    """
+    Логирует, какие переменные сократического диалога есть в каталоге сообщений.
+    Вызывается из main() после загрузки каталога, а не при импорте модуля.
+    Возвращает список отсутствующих ключей.
+    """
+    logger.info("=== Загрузка переменных из Google Sheets ===")
+    logger.info(f"Попытка загрузить {len(REQUIRED_MESSAGES)} переменных для сократического диалога")
+
+    # Словарь для хранения загруженных значений
+    loaded_messages = {}
+    missing_messages = []
+
+    for msg_key, description in REQUIRED_MESSAGES.items():
+        value = get_local_message(msg_key)
+        if value:
+            loaded_messages[msg_key] = value
+            logger.info(f"✓ {msg_key} ({description}):")
+            logger.info(f"  Значение: {value[:100]}..." if len(value) > 100 else f"  Значение: {value}")
+        else:
+            missing_messages.append(msg_key)
+            logger.warning(f"✗ {msg_key} ({description}): не найдено в таблице")
+
+    # Итоговая статистика
+    logger.info("=== Итоги загрузки переменных ===")
+    logger.info(f"Успешно загружено: {len(loaded_messages)} из {len(REQUIRED_MESSAGES)}")
+    if missing_messages:
+        logger.warning("Отсутствующие переменные:")
+        for key in missing_messages:
+            logger.warning(f"  - {key} ({REQUIRED_MESSAGES[key]})")
+    return missing_messages
 
 router = Router()
 
+# Ответы короче этого не дают повода перестраивать план («да», «не знаю»)
+REPLAN_MIN_WORDS = 5
+
 # FSM-состояния
 class SocraticFSM(StatesGroup):
     waiting_for_answer = State()
     done = State()
 
+async def update_question_plan(message: types.Message, data: dict, config, user_request: str,
+                               dialog_history: list, answer_text: str, remaining: int):
+    """
+    План оставшихся вопросов диалога: строится одним запросом к модели после
+    первого ответа и перестраивается, только если ответ резко ушёл в сторону
+    от запроса и плана. Возвращает (план, число перестроений).
+    """
+    plan = data.get('question_plan') or []
+    replans = data.get('replans', 0)
+    if not plan:
+        async with llm_slot(message):
+            return await plan_socratic_questions_openrouter(user_request, dialog_history, remaining), replans
+    if replans >= config.socratic_max_replans or len(answer_text.split()) < REPLAN_MIN_WORDS:
+        return plan, replans
+    divergence = answer_divergence(answer_text, [user_request, data.get('current_question'), *plan])
+    if divergence < config.socratic_replan_divergence:
+        return plan, replans
+    logger.info(f"Ответ ушёл от плана (расхождение {divergence:.2f}), перестраиваем оставшиеся вопросы")
+    async with llm_slot(message):
+        new_plan = await plan_socratic_questions_openrouter(user_request, dialog_history, remaining)
+    return new_plan or plan, replans + 1
+
 async def process_answer(message: types.Message, state: FSMContext, answer_text: str):
     """Обработка ответа пользователя и генерация следующего вопроса"""
     data = await state.get_data()
-    dialog_history = data.get('dialog_history', [])
     current_question = data.get('current_question')
     question_count = data.get('question_count', 0)
+    session_id = data.get('session_id') or uuid.uuid4().hex[:12]
+    topic_id = data.get('topic_id')
+    if not topic_id:
+        topic_id = await create_topic(message.from_user.id)
+        await state.update_data(topic_id=topic_id)
     config = load_config()
     
-    # Добавляем текущий вопрос и ответ в историю
-    dialog_history.append((current_question, answer_text))
-    
-    # Сохраняем всю историю диалога в Google Sheets (дописываем в колонку questions)
-    save_questions_block(message.from_user.id, dialog_history)
+    # История диалога живёт в таблице answers: одна строка на ход, FSM хранит только указатель.
+    # Текущий ход записывается, только когда следующий вопрос получен: если генерацию
+    # отклонили или она упала, повторный ответ пользователя не создаст дубль
+    dialog_history = await get_topic_history(topic_id) + [(current_question, answer_text)]
+
+    async def record_turn():
+        await add_answer(topic_id, question_count + 1, current_question, answer_text)
+        # Дописываем в журнал диалогов только новую пару вопрос/ответ
+        save_dialog_turn(message.from_user.id, session_id, question_count + 1, current_question, answer_text)
     
     # Проверяем, достигли ли мы нужного количества вопросов
     if question_count + 1 >= config.socratic_questions_count:
+        await record_turn()
         # Получаем и отправляем сообщение о завершении
         completion_msg = get_local_message("completion_message")
         await message.answer(completion_msg)
@@ -88,29 +136,62 @@ async def process_answer(message: types.Message, state: FSMContext, answer_text:
         if final_message:
             await message.answer(final_message)
         
-        # Сохраняем результаты диалога в отдельную колонку
+        # Сохраняем результаты диалога в БД (в колонку ai_result их выгрузит фоновый экспорт)
         dialog_summary = "\n".join([f"Вопрос: {q}\nОтвет: {a}\n" for q, a in dialog_history])
-        save_ai_result(message.from_user.id, dialog_summary)
+        await save_user_ai_result(message.from_user.id, dialog_summary)
         
         await state.set_state(SocraticFSM.done)
         return
 
-    # Генерируем следующий вопрос через ИИ на основе всей истории диалога
-    next_question = await generate_next_socratic_question_openrouter(
-        user_request=dialog_history[0][1] if dialog_history else "",  # Первый ответ как контекст
-        history=dialog_history,
-        openrouter_api_key=config.openrouter_api_key
-    )
+    user_request = dialog_history[0][1] if dialog_history else ""  # Первый ответ как контекст
+    plan, replans = [], data.get('replans', 0)
+    next_question = None
+    try:
+        if config.socratic_plan_mode:
+            # Берём вопрос из плана — без обращения к модели на каждом ходу
+            plan, replans = await update_question_plan(
+                message, data, config, user_request, dialog_history, answer_text,
+                remaining=config.socratic_questions_count - question_count - 1
+            )
+            if plan:
+                next_question, plan = plan[0], plan[1:]
+                await message.answer(f"Вопрос {question_count + 2}:\n{next_question}")
+
+        # Без плана генерируем следующий вопрос через ИИ на основе всей истории диалога
+        if next_question is None:
+            async with llm_slot(message):
+                if config.llm_streaming:
+                    # Вопрос появляется в чате по мере генерации
+                    next_question = await stream_to_message(
+                        message,
+                        stream_next_socratic_question_openrouter(user_request=user_request, history=dialog_history),
+                        prefix=f"Вопрос {question_count + 2}:\n",
+                        interval=config.llm_stream_edit_interval
+                    )
+                else:
+                    next_question = await generate_next_socratic_question_openrouter(
+                        user_request=user_request,
+                        history=dialog_history
+                    )
+                    # Задаем следующий вопрос
+                    await message.answer(f"Вопрос {question_count + 2}:\n{next_question}")
+    except (LLMBusyError, LLMOverloadedError) as e:
+        logger.warning(f"Генерация вопроса для {message.from_user.id} отклонена: {e}")
+        await message.answer(llm_error_message(e))
+        return
+
+    await record_turn()
     
     # Обновляем состояние
     await state.update_data(
-        dialog_history=dialog_history,
         current_question=next_question,
-        question_count=question_count + 1
+        question_count=question_count + 1,
+        session_id=session_id,
+        topic_id=topic_id,
+        question_plan=plan,
+        replans=replans
     )
     
-    # Задаем следующий вопрос
-    await message.answer(f"Вопрос {question_count + 2}:\n{next_question}")
     await state.set_state(SocraticFSM.waiting_for_answer)
 
 # --- Обработчик старта диалога ---
@@ -127,9 +208,12 @@ async def start_socratic_dialog(message: types.Message, state: FSMContext):
 
     # Сохраняем состояние
     await state.update_data(
-        dialog_history=[],
+        topic_id=await create_topic(message.from_user.id),
         current_question=initial_question,
-        question_count=0
+        question_count=0,
+        session_id=uuid.uuid4().hex[:12],
+        question_plan=[],
+        replans=0
     )
     
     # Задаем первый вопрос
@@ -1,5 +1,20 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+
+# Колбэки листания мантр: mp:<n|p>:<created_at в микросекундах>:<id>
+MANTRAS_PAGE_PREFIX = "mp:"
+_EPOCH = datetime(1970, 1, 1)
+
+def mantras_page_callback(direction: str, cursor: Tuple[datetime, int]) -> str:
+    """Колбэк страницы мантр: ``n`` — следующая после курсора, ``p`` — предыдущая перед ним"""
+    created_at, mantra_id = cursor
+    return f"{MANTRAS_PAGE_PREFIX}{direction}:{(created_at - _EPOCH) // timedelta(microseconds=1)}:{mantra_id}"
+
+def parse_mantras_page_callback(data: str) -> Tuple[str, Tuple[datetime, int]]:
+    """Обратное к ``mantras_page_callback``: (направление, курсор)"""
+    direction, epoch_us, mantra_id = data[len(MANTRAS_PAGE_PREFIX):].split(":")
+    return direction, (_EPOCH + timedelta(microseconds=int(epoch_us)), int(mantra_id))
 
 def main_menu_keyboard() -> ReplyKeyboardMarkup:
     """Основное меню бота"""
@@ -8,8 +23,9 @@ def main_menu_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
-def my_mantras_keyboard(mantras: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
-    """Клавиатура со списком мантр пользователя"""
+def my_mantras_keyboard(mantras: List[Dict[str, Any]], prev_cursor: Optional[Tuple[datetime, int]] = None,
+                        next_cursor: Optional[Tuple[datetime, int]] = None) -> InlineKeyboardMarkup:
+    """Клавиатура с одной страницей мантр пользователя и кнопками листания"""
     keyboard = []
     for mantra in mantras:
         keyboard.append([
@@ -18,6 +34,13 @@ def my_mantras_keyboard(mantras: List[Dict[str, Any]]) -> InlineKeyboardMarkup:
                 callback_data=f"mantra_{mantra['id']}"
             )
         ])
+    navigation = []
+    if prev_cursor:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=mantras_page_callback("p", prev_cursor)))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=mantras_page_callback("n", next_cursor)))
+    if navigation:
+        keyboard.append(navigation)
     keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_main")])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterable, Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Что показываем, пока не пришёл первый фрагмент, и в конце ещё растущего текста
+PLACEHOLDER = '⏳'
+CURSOR = ' ▌'
+
+
+class LiveMessage:
+    """
+    Сообщение, которое дописывается по мере генерации текста.
+
+    Сразу отправляет заглушку, затем правит её: первый фрагмент показывается
+    без задержки, дальше правки идут не чаще раза в ``interval`` секунд —
+    Telegram ограничивает частоту правок в одном чате. Промежуточные правки
+    идут без разметки (недописанный HTML не распарсится), итоговая — с
+    разметкой бота по умолчанию. Править можно только инлайн-клавиатуру:
+    обычное меню (ReplyKeyboardMarkup) отправляется отдельным сообщением.
+    """
+
+    def __init__(self, message: types.Message, prefix: str = '', interval: float = 1.0):
+        self.message = message
+        self.prefix = prefix
+        self.interval = interval
+        self.sent: Optional[types.Message] = None
+        self._shown = None
+        self._next_edit = 0.0
+        self.edits = 0
+
+    def _render(self, text: str, suffix: str = '') -> str:
+        return (self.prefix + text)[:MESSAGE_LIMIT - len(suffix)] + suffix
+
+    async def start(self):
+        self.sent = await self.message.answer(self._render(PLACEHOLDER), parse_mode=None)
+
+    async def update(self, text: str):
+        """Промежуточная правка, если подошло время"""
+        if not text.strip() or time.monotonic() < self._next_edit:
+            return
+        try:
+            await self._edit(self._render(text, CURSOR), parse_mode=None)
+        except TelegramBadRequest as e:
+            # Промежуточная правка не важна — генерацию из-за неё не прерываем
+            logger.debug(f"Промежуточная правка не удалась: {e}")
+            self._next_edit = time.monotonic() + self.interval
+
+    async def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """
+        Итоговый текст: правится всегда, при необходимости дожидаясь лимита.
+        Не бросает исключений — готовый текст не должен теряться из-за неудачной правки.
+        """
+        delay = self._next_edit - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        rendered = self._render(text)
+        try:
+            await self._edit(rendered, reply_markup=reply_markup, force=True)
+            return
+        except Exception as e:
+            # Текст модели не всегда валидный HTML — показываем как есть
+            logger.warning(f"Не удалось применить разметку к итоговому тексту: {e}")
+        try:
+            await self._edit(rendered, reply_markup=reply_markup, parse_mode=None, force=True)
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось отредактировать сообщение, отправляем итог отдельно: {e}")
+        try:
+            await self.message.answer(rendered, parse_mode=None)
+        except Exception as e:
+            logger.error(f"Не удалось показать итоговый текст: {e}")
+
+    async def _edit(self, text: str, force: bool = False, **kwargs):
+        if self.sent is None:
+            await self.start()
+        if text == self._shown and not kwargs.get('reply_markup'):
+            return
+        while True:
+            try:
+                await self.sent.edit_text(text, **kwargs)
+            except TelegramRetryAfter as e:
+                self._next_edit = time.monotonic() + e.retry_after
+                if not force:
+                    return
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramBadRequest as e:
+                if 'message is not modified' not in str(e):
+                    raise
+            break
+        self._shown = text
+        self._next_edit = time.monotonic() + self.interval
+        self.edits += 1
+
+
+async def stream_to_message(message: types.Message, chunks: AsyncIterable[str], prefix: str = '',
+                            reply_markup: Optional[InlineKeyboardMarkup] = None, interval: float = 1.0) -> str:
+    """
+    Показывает поток фрагментов ``chunks`` в новом сообщении и возвращает
+    итоговый текст. Если поток оборвался, заглушка удаляется, а ошибка
+    пробрасывается дальше — вызывающий сам сообщит о ней пользователю.
+    """
+    live = LiveMessage(message, prefix=prefix, interval=interval)
+    await live.start()
+    text = ''
+    try:
+        async for chunk in chunks:
+            text += chunk
+            await live.update(text)
+    except Exception:
+        try:
+            await live.sent.delete()
+        except Exception as e:
+            logger.debug(f"Не удалось удалить заглушку: {e}")
+        raise
+    text = text.strip()
+    await live.finish(text, reply_markup=reply_markup)
+    return text
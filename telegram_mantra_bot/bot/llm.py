@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_API_URL = 'https://openrouter.ai/api/v1'
+
+# Ответы, которые имеет смысл повторить: превышение лимита и ошибки сервера
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Ошибка ответа LLM API"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"LLM API {status_code}: {message}")
+        self.status_code = status_code
+
+
+class OpenRouterClient:
+    """
+    Асинхронный клиент OpenRouter (OpenAI-совместимый ``/chat/completions``).
+
+    Работает поверх одного ``httpx.AsyncClient`` с пулом keep-alive соединений:
+    десятки генераций идут параллельно без потоков и не блокируют event loop.
+    Ключ и модель задаются при создании, но любой запрос может их переопределить —
+    глобальные ``openai.api_key``/``api_base`` больше не нужны.
+    """
+
+    def __init__(self, api_key: str, model: str, base_url: str = OPENROUTER_API_URL,
+                 timeout: float = 60.0, connect_timeout: float = 10.0, max_connections: int = 50,
+                 max_retries: int = 2, backoff_base: float = 1.0, backoff_max: float = 16.0,
+                 referer: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        headers = {'HTTP-Referer': referer} if referer else {}
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip('/') + '/',
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            # Подменяется в тестах и бенчмарках
+            transport=transport,
+        )
+        self.metrics = {
+            'calls': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'server_errors': 0,
+            'transport_errors': 0,
+            'failed': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'last_call_seconds': 0.0,
+            'streams': 0,
+            'last_first_token_seconds': 0.0,
+        }
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Экспоненциальная задержка с полным джиттером, но не меньше Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    def _payload(self, messages: List[Dict[str, str]], model: Optional[str], max_tokens: Optional[int],
+                 temperature: Optional[float], extra: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {'model': model or self.model, 'messages': messages, **extra}
+        if max_tokens is not None:
+            payload['max_tokens'] = max_tokens
+        if temperature is not None:
+            payload['temperature'] = temperature
+        return payload
+
+    def _headers(self, api_key: Optional[str]) -> Dict[str, str]:
+        return {'Authorization': f'Bearer {api_key or self.api_key}'}
+
+    async def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                   max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                   api_key: Optional[str] = None, **extra) -> Dict[str, Any]:
+        """Один запрос ``/chat/completions`` с повторами на 429/5xx. Возвращает JSON ответа."""
+        payload = self._payload(messages, model, max_tokens, temperature, extra)
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            retry_after = None
+            try:
+                response = await self._http.post('chat/completions', json=payload, headers=self._headers(api_key))
+            except httpx.TransportError as e:
+                self.metrics['transport_errors'] += 1
+                error = e
+            else:
+                self.metrics['calls'] += 1
+                self.metrics['last_call_seconds'] = time.monotonic() - started
+                logger.debug(f"LLM {payload['model']}: {response.status_code} за {self.metrics['last_call_seconds']:.2f}с")
+                if response.status_code < 400:
+                    data = response.json()
+                    usage = data.get('usage') or {}
+                    self.metrics['prompt_tokens'] += usage.get('prompt_tokens', 0)
+                    self.metrics['completion_tokens'] += usage.get('completion_tokens', 0)
+                    return data
+                error = LLMError(response.status_code, response.text[:500])
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.metrics['failed'] += 1
+                    raise error
+                if response.status_code == 429:
+                    self.metrics['rate_limited'] += 1
+                else:
+                    self.metrics['server_errors'] += 1
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            self.metrics['retries'] += 1
+            logger.warning(f"LLM {payload['model']}: {error}; повтор через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+        self.metrics['failed'] += 1
+        raise error
+
+    async def complete(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Текст первого варианта ответа"""
+        data = await self.chat(messages, **kwargs)
+        try:
+            return (data['choices'][0]['message']['content'] or '').strip()
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(200, f"Неожиданный ответ: {str(data)[:500]}")
+
+    async def stream(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                     max_tokens: Optional[int] = None, temperature: Optional[float] = None,
+                     api_key: Optional[str] = None, **extra) -> AsyncIterator[str]:
+        """
+        Потоковый ``/chat/completions`` (SSE): отдаёт фрагменты текста по мере генерации.
+
+        Повторяется только запрос, не успевший отдать ни одного фрагмента —
+        иначе пользователь увидел бы текст дважды.
+        """
+        payload = self._payload(messages, model, max_tokens, temperature, {**extra, 'stream': True})
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            retry_after = None
+            first = True
+            try:
+                async with self._http.stream('POST', 'chat/completions', json=payload,
+                                             headers=self._headers(api_key)) as response:
+                    self.metrics['calls'] += 1
+                    if response.status_code >= 400:
+                        await response.aread()
+                        error = LLMError(response.status_code, response.text[:500])
+                        if response.status_code not in RETRYABLE_STATUSES:
+                            self.metrics['failed'] += 1
+                            raise error
+                        if response.status_code == 429:
+                            self.metrics['rate_limited'] += 1
+                        else:
+                            self.metrics['server_errors'] += 1
+                        retry_after = response.headers.get('Retry-After')
+                    else:
+                        self.metrics['streams'] += 1
+                        async for delta in self._iter_sse(response):
+                            if first:
+                                first = False
+                                self.metrics['last_first_token_seconds'] = time.monotonic() - started
+                            yield delta
+                        self.metrics['last_call_seconds'] = time.monotonic() - started
+                        return
+            except httpx.TransportError as e:
+                self.metrics['transport_errors'] += 1
+                if not first:
+                    # Обрыв посреди ответа: часть текста уже отдана, повторять нельзя
+                    self.metrics['failed'] += 1
+                    raise
+                error = e
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            self.metrics['retries'] += 1
+            logger.warning(f"LLM {payload['model']} (stream): {error}; повтор через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+        self.metrics['failed'] += 1
+        raise error
+
+    async def _iter_sse(self, response: httpx.Response) -> AsyncIterator[str]:
+        """Текстовые дельты из потока ``data: {...}``; комментарии-пинги OpenRouter пропускаются"""
+        async for line in response.aiter_lines():
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                return
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                logger.debug(f"LLM: не удалось разобрать фрагмент потока: {data[:200]}")
+                continue
+            if chunk.get('error'):
+                raise LLMError(200, str(chunk['error'])[:500])
+            usage = chunk.get('usage') or {}
+            self.metrics['prompt_tokens'] += usage.get('prompt_tokens', 0)
+            self.metrics['completion_tokens'] += usage.get('completion_tokens', 0)
+            for choice in chunk.get('choices') or []:
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    yield delta
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.metrics)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+# Глобальный клиент LLM
+llm_client = None
+
+def init_llm_client(config=None) -> OpenRouterClient:
+    """Создаёт общий клиент по конфигурации (повторный вызов возвращает уже созданный)"""
+    global llm_client
+    if llm_client is None:
+        if config is None:
+            from .config import load_config
+            config = load_config()
+        llm_client = OpenRouterClient(
+            api_key=config.openrouter_api_key,
+            model=config.ai_model,
+            base_url=config.llm_base_url,
+            timeout=config.llm_timeout,
+            connect_timeout=config.llm_connect_timeout,
+            max_connections=config.llm_max_connections,
+            max_retries=config.llm_max_retries,
+            referer=config.llm_http_referer,
+        )
+    return llm_client
+
+def get_llm_client() -> OpenRouterClient:
+    return llm_client or init_llm_client()
+
+async def close_llm_client():
+    global llm_client
+    if llm_client:
+        await llm_client.aclose()
+        llm_client = None
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+from .messages import get_message
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBusyError(Exception):
+    """У пользователя уже есть незавершённая генерация"""
+
+
+class LLMOverloadedError(Exception):
+    """Очередь генераций переполнена"""
+
+
+def percentile(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class LLMScheduler:
+    """
+    Ограничитель одновременных генераций LLM.
+
+    Одновременно выполняется не больше ``max_concurrent`` генераций на весь
+    бот, а у каждого пользователя — не больше одной: повторный запрос, пока
+    предыдущий не завершился, отклоняется с ``LLMBusyError``. Остальные ждут
+    в очереди по порядку поступления; раз у пользователя в очереди максимум
+    одно место, очередь честная — никто не займёт её целиком. Освободившийся
+    слот передаётся первому ожидающему напрямую. Если очередь длиннее
+    ``max_queue``, новые запросы сразу получают ``LLMOverloadedError`` —
+    лучше быстро отказать, чем заставить ждать минутами.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 200, window: int = 1000):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiting: Deque[asyncio.Future] = deque()
+        self._users: Set[int] = set()
+        # Последние замеры ожидания и обслуживания, секунды
+        self._wait_samples: Deque[float] = deque(maxlen=window)
+        self._service_samples: Deque[float] = deque(maxlen=window)
+        self.metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'queued': 0,
+            'rejected_busy': 0,
+            'rejected_overloaded': 0,
+            'max_queue_depth': 0,
+        }
+
+    @property
+    def depth(self) -> int:
+        """Количество ожидающих слот"""
+        return sum(1 for fut in self._waiting if not fut.done())
+
+    def _release(self):
+        """Передаёт слот первому живому ожидающему или возвращает его в пул"""
+        while self._waiting:
+            fut = self._waiting.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    async def _acquire(self, on_queued: Optional[Callable[[int], Awaitable[Any]]]):
+        if self._active < self.max_concurrent and not self.depth:
+            self._active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiting.append(fut)
+        position = self.depth
+        self.metrics['queued'] += 1
+        self.metrics['max_queue_depth'] = max(self.metrics['max_queue_depth'], position)
+        try:
+            if on_queued:
+                try:
+                    await on_queued(position)
+                except Exception as e:
+                    logger.warning(f"Не удалось сообщить позицию в очереди LLM: {e}")
+            await fut
+        except asyncio.CancelledError:
+            # Отмена могла прийти и во время уведомления, когда слот уже передан
+            if fut.done() and not fut.cancelled():
+                # Слот уже передан нам — отдаём его следующему
+                self._release()
+            else:
+                fut.cancel()
+            raise
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, on_queued: Optional[Callable[[int], Awaitable[Any]]] = None):
+        """
+        Слот для одной генерации пользователя ``user_id``.
+        ``on_queued(position)`` вызывается, если пришлось встать в очередь.
+        """
+        if user_id in self._users:
+            self.metrics['rejected_busy'] += 1
+            raise LLMBusyError(f"У пользователя {user_id} уже есть генерация")
+        if self._active >= self.max_concurrent and self.depth >= self.max_queue:
+            self.metrics['rejected_overloaded'] += 1
+            raise LLMOverloadedError(f"Очередь генераций переполнена ({self.depth})")
+        self._users.add(user_id)
+        self.metrics['submitted'] += 1
+        try:
+            enqueued = time.monotonic()
+            await self._acquire(on_queued)
+            started = time.monotonic()
+            self._wait_samples.append(started - enqueued)
+            try:
+                yield
+            except Exception:
+                self.metrics['failed'] += 1
+                raise
+            else:
+                self.metrics['completed'] += 1
+            finally:
+                self._service_samples.append(time.monotonic() - started)
+                self._release()
+        finally:
+            self._users.discard(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'active': self._active,
+            'queue_depth': self.depth,
+            'wait_p50': percentile(self._wait_samples, 50),
+            'wait_p95': percentile(self._wait_samples, 95),
+            'service_p50': percentile(self._service_samples, 50),
+            'service_p95': percentile(self._service_samples, 95),
+        }
+
+
+# Глобальный планировщик генераций
+llm_scheduler = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Общий планировщик, настроенный по конфигурации (создаётся при первом обращении)"""
+    global llm_scheduler
+    if llm_scheduler is None:
+        from .config import load_config
+        config = load_config()
+        llm_scheduler = LLMScheduler(max_concurrent=config.llm_max_concurrent, max_queue=config.llm_max_queue)
+    return llm_scheduler
+
+def llm_slot(message, user_id: Optional[int] = None):
+    """
+    Слот генерации пользователя ``user_id`` (по умолчанию — автора сообщения);
+    о месте в очереди пользователь узнаёт ответом в чат сообщения. Для
+    сообщений бота (callback-кнопки) ``user_id`` нужно передавать явно.
+    """
+    async def notify(position: int):
+        text = get_message("llm_queue_position", "⏳ Сейчас много запросов. Ваше место в очереди: {position}")
+        await message.answer(text.format(position=position))
+    return get_llm_scheduler().slot(user_id or message.from_user.id, on_queued=notify)
+
+def llm_error_message(error: Exception) -> str:
+    """Текст для пользователя, если генерацию не удалось поставить в очередь"""
+    if isinstance(error, LLMBusyError):
+        return get_message("llm_busy", "Предыдущий запрос ещё обрабатывается, пожалуйста, подождите.")
+    return get_message("llm_overloaded", "Сейчас слишком много запросов. Пожалуйста, попробуйте через минуту.")
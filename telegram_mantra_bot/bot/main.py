@@ -4,12 +4,13 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand, BotCommandScopeDefault
 from aiogram.client.default import DefaultBotProperties
 from telegram_mantra_bot.bot.config import load_config
-from telegram_mantra_bot.bot.sheets import init_sheets_client
-from telegram_mantra_bot.bot.messages import load_all_messages
+from telegram_mantra_bot.bot.sheets import init_sheets_client, run_write_queue, stop_write_queue, close_sheets_client
+from telegram_mantra_bot.bot.messages import load_all_messages, load_messages_snapshot, run_messages_refresh
+from telegram_mantra_bot.bot import models
+from telegram_mantra_bot.bot.llm import init_llm_client, close_llm_client
 from aiogram import types
 
 # Настраиваем логирование
@@ -40,28 +41,50 @@ async def main():
     # Загружаем конфигурацию
     config = load_config()
     
+    # Сначала поднимаем сообщения из локального снимка — это миллисекунды и не требует сети
+    has_snapshot = load_messages_snapshot(config.messages_snapshot_path)
+    
+    # Движок БД создаётся явно здесь, а не при импорте models
+    models.init(config=config)
+    await models.init_db()
+    # Общий пул соединений к OpenRouter
+    init_llm_client(config)
+    
     # Инициализируем Google Sheets клиент
     logger.info("Инициализация Google Sheets клиента...")
-    if not init_sheets_client():
-        logger.error("Не удалось инициализировать Google Sheets клиент!")
-        return
+    sheets_ready = init_sheets_client()
+    if not sheets_ready:
+        if not has_snapshot:
+            logger.error("Не удалось инициализировать Google Sheets клиент!")
+            return
+        logger.warning("Google Sheets недоступен, работаем на локальном снимке сообщений")
     
-    # Загружаем сообщения из Google Sheets
-    logger.info("Загрузка сообщений из Google Sheets...")
-    load_all_messages()
+    # Сверяем каталог с Google Sheets: при наличии снимка — в фоне, без задержки старта
+    messages_reconcile = None
+    if sheets_ready:
+        if has_snapshot:
+            messages_reconcile = asyncio.create_task(load_all_messages())
+        else:
+            logger.info("Загрузка сообщений из Google Sheets...")
+            await load_all_messages()
     
     # Инициализируем бота и диспетчер
     bot = Bot(token=config.bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    storage = MemoryStorage()
+    # Состояния диалогов хранятся в БД: переживают перезапуск и общие для всех воркеров
+    from telegram_mantra_bot.bot.fsm_storage import create_fsm_storage
+    storage = create_fsm_storage(config.fsm_storage, ttl=config.fsm_ttl)
     dp = Dispatcher(storage=storage)
     
     # Импортируем и регистрируем роутеры только после полной инициализации
     from telegram_mantra_bot.bot.handlers.start import router as start_router
-    from telegram_mantra_bot.bot.handlers.socratic import router as socratic_router
+    from telegram_mantra_bot.bot.handlers.socratic import router as socratic_router, log_required_messages
     from telegram_mantra_bot.bot.handlers.mantra_actions import router as mantra_actions_router
     from telegram_mantra_bot.bot.handlers.gpt import router as gpt_router
     from telegram_mantra_bot.bot.handlers.voice import router as voice_router
     
+    # Проверяем, что в каталоге есть всё нужное для сократического диалога
+    log_required_messages()
+    
     # Глобальный fallback-хендлер
     async def fallback_handler(update: types.Update):
         user_id = None
@@ -86,9 +109,56 @@ async def main():
     # Устанавливаем команды бота
     await set_commands(bot)
     
+    # Запускаем фоновую выгрузку записей в Google Sheets
+    sheets_writer = asyncio.create_task(run_write_queue())
+    # Выгрузку пользователей из БД в лист Users
+    from telegram_mantra_bot.bot.sheets_export import run_users_export
+    users_export = asyncio.create_task(run_users_export(config.sheets_export_interval, config.sheets_export_batch, config.sheets_export_lag))
+    # Рассылку напоминаний
+    from telegram_mantra_bot.bot.reminder_dispatcher import run_reminder_dispatcher
+    reminders = asyncio.create_task(run_reminder_dispatcher(
+        bot,
+        batch_size=config.reminders_batch_size,
+        window_seconds=config.reminders_window_seconds,
+        refill_interval=config.reminders_refill_interval,
+        lease_seconds=config.reminders_lease_seconds,
+        messages_per_second=config.telegram_messages_per_second,
+        concurrency=config.reminders_send_concurrency
+    ))
+    # Архивацию устаревших данных
+    from telegram_mantra_bot.bot.retention import run_retention
+    retention = asyncio.create_task(run_retention(
+        interval=config.retention_interval,
+        chunk_size=config.retention_chunk_size,
+        chunk_pause=config.retention_chunk_pause,
+        archive_dir=config.retention_archive_dir,
+        reminders_days=config.retention_reminders_days,
+        dialogs_days=config.retention_dialogs_days,
+        audio_orders_days=config.retention_audio_orders_days,
+        mantras_days=config.retention_mantras_days
+    ))
+    # И периодическое обновление каталога сообщений
+    messages_refresher = asyncio.create_task(
+        run_messages_refresh(config.messages_refresh_interval if sheets_ready else 0)
+    )
+    
     # Запускаем поллинг
     logger.info("Starting bot...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        users_export.cancel()
+        reminders.cancel()
+        retention.cancel()
+        messages_refresher.cancel()
+        if messages_reconcile:
+            messages_reconcile.cancel()
+        # Дожидаемся выгрузки хвоста очереди
+        stop_write_queue()
+        await sheets_writer
+        await close_sheets_client()
+        await close_llm_client()
+        await models.close_db()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,232 @@
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Простое число Мерсенна для универсального хеширования MinHash
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text: str) -> str:
+    """Нормализованный запрос: нижний регистр, ё -> е, без пунктуации и лишних пробелов"""
+    text = text.lower().replace('ё', 'е')
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def char_ngrams(text: str, n: int = 3) -> FrozenSet[str]:
+    """Символьные n-граммы нормализованного текста (с пробелами по краям, чтобы учитывать начала слов)"""
+    padded = f' {text} '
+    if len(padded) <= n:
+        return frozenset([padded])
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры для множеств n-грамм и LSH-ключи полос.
+
+    Хеши n-грамм — crc32, перестановки — ``(a * x + b) mod p`` с
+    фиксированными коэффициентами, поэтому сигнатуры воспроизводимы между
+    запусками. Сигнатура из ``bands * rows`` значений режется на полосы:
+    два запроса становятся кандидатами, если совпала хотя бы одна полоса.
+    """
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        state = seed
+        self._coefficients = []
+        for _ in range(bands * rows):
+            # Детерминированный LCG вместо random — не трогаем глобальный генератор
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = (state >> 3) % (_PRIME - 1) + 1
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            b = (state >> 3) % _PRIME
+            self._coefficients.append((a, b))
+
+    def signature(self, shingles: FrozenSet[str]) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles]
+        return tuple(
+            min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._coefficients
+        )
+
+    def band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+
+class _Entry:
+    __slots__ = ('kind', 'key', 'shingles', 'bands', 'variants', 'served', 'created_at')
+
+    def __init__(self, kind: str, key: str, shingles: FrozenSet[str], bands, text: str):
+        self.kind = kind
+        self.key = key
+        self.shingles = shingles
+        self.bands = bands
+        self.variants = [text]
+        self.served = 0
+        self.created_at = time.monotonic()
+
+
+class MantraCache:
+    """
+    Кэш сгенерированных мантр с поиском по похожим запросам.
+
+    Запрос нормализуется и раскладывается на символьные триграммы; кандидаты
+    ищутся по LSH-индексу MinHash-сигнатур, а решение принимается по точной
+    мере Жаккара с порогом ``threshold``. Так «Тревога!» и «тревога»
+    совпадают полностью, «тревога и страх» и «страх и тревога» — близки,
+    а «страх» и «страх публичных выступлений» — нет.
+
+    Запись живёт ``ttl`` секунд, всего записей не больше ``maxsize``
+    (вытесняются давно не использованные). В записи копится до
+    ``max_variants`` мантр для похожих запросов; попадания выдают их по
+    очереди, чтобы повторный запрос не получал ту же самую мантру.
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: float = 86400.0, threshold: float = 0.6,
+                 max_variants: int = 3, ngram: int = 3):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_variants = max_variants
+        self.ngram = ngram
+        self.hasher = MinHasher()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._index: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._next_id = 0
+        self.metrics = {
+            'lookups': 0,
+            'hits': 0,
+            'exact_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'merged': 0,
+            'evicted': 0,
+            'expired': 0,
+        }
+
+    def _prepare(self, text: str):
+        key = normalize(text)
+        shingles = char_ngrams(key, self.ngram)
+        return key, shingles, self.hasher.band_keys(self.hasher.signature(shingles))
+
+    def _remove(self, entry_id: int, reason: str):
+        entry = self._entries.pop(entry_id)
+        for band in entry.bands:
+            bucket = self._index.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._index[band]
+        self.metrics[reason] += 1
+
+    def _find(self, kind: str, key: str, shingles, bands) -> Tuple[Optional[int], float]:
+        """Самая похожая живая запись того же вида не ниже порога"""
+        candidates = set()
+        for band in bands:
+            candidates |= self._index.get(band, set())
+        now = time.monotonic()
+        best_id, best_score = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if self.ttl and now - entry.created_at > self.ttl:
+                self._remove(entry_id, 'expired')
+                continue
+            if entry.kind != kind:
+                continue
+            score = 1.0 if entry.key == key else jaccard(shingles, entry.shingles)
+            if score >= self.threshold and score > best_score:
+                best_id, best_score = entry_id, score
+        return best_id, best_score
+
+    def get(self, text: str, kind: str = 'request') -> Optional[str]:
+        """Мантра для похожего запроса или None"""
+        if not self.maxsize:
+            return None
+        self.metrics['lookups'] += 1
+        key, shingles, bands = self._prepare(text)
+        entry_id, score = self._find(kind, key, shingles, bands)
+        if entry_id is None:
+            self.metrics['misses'] += 1
+            return None
+        entry = self._entries[entry_id]
+        self._entries.move_to_end(entry_id)
+        variant = entry.variants[entry.served % len(entry.variants)]
+        entry.served += 1
+        self.metrics['hits'] += 1
+        if score == 1.0:
+            self.metrics['exact_hits'] += 1
+        logger.info(f"Кэш мантр: попадание (сходство {score:.2f}), доля попаданий {self.hit_rate():.0%}")
+        return variant
+
+    def put(self, text: str, mantra: str, kind: str = 'request'):
+        """Запоминает мантру; для похожего запроса она добавляется вариантом к существующей записи"""
+        if not self.maxsize or not mantra:
+            return
+        key, shingles, bands = self._prepare(text)
+        entry_id, _ = self._find(kind, key, shingles, bands)
+        if entry_id is not None:
+            entry = self._entries[entry_id]
+            if mantra not in entry.variants:
+                entry.variants.append(mantra)
+                del entry.variants[:-self.max_variants]
+            self._entries.move_to_end(entry_id)
+            self.metrics['merged'] += 1
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(kind, key, shingles, bands, mantra)
+        for band in bands:
+            self._index.setdefault(band, set()).add(entry_id)
+        self.metrics['stores'] += 1
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)), 'evicted')
+
+    def clear(self):
+        self._entries.clear()
+        self._index.clear()
+
+    def hit_rate(self) -> float:
+        return self.metrics['hits'] / self.metrics['lookups'] if self.metrics['lookups'] else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hit_rate(),
+        }
+
+
+# Глобальный кэш мантр
+mantra_cache = None
+
+def get_mantra_cache() -> MantraCache:
+    """Общий кэш, настроенный по конфигурации (создаётся при первом обращении)"""
+    global mantra_cache
+    if mantra_cache is None:
+        from .config import load_config
+        config = load_config()
+        mantra_cache = MantraCache(
+            maxsize=config.mantra_cache_size,
+            ttl=config.mantra_cache_ttl,
+            threshold=config.mantra_cache_threshold,
+            max_variants=config.mantra_cache_variants,
+        )
+    return mantra_cache
@@ -1,71 +1,118 @@
 import os
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+from types import MappingProxyType
 from dotenv import load_dotenv
-from .sheets import init_sheets_client, get_message as get_gsheet_message
+from .sheets import init_sheets_client, get_all_messages as get_gsheet_messages
 import logging
 
 # Настраиваем логгер
 logger = logging.getLogger(__name__)
 
-# Кэш для всех сообщений
-_messages_cache = {}  # Инициализируем как пустой словарь вместо None
+# Снимок всех сообщений: неизменяемый словарь, который целиком подменяется при обновлении,
+# поэтому читатели никогда не видят наполовину загруженный каталог
+_messages_cache = MappingProxyType({})
+# Хеш содержимого текущего снимка — чтобы не пересобирать кэш, если ничего не изменилось
+_messages_digest = None
+# Файл с последним удачным снимком каталога (для мгновенного и офлайн-старта)
+_snapshot_path = None
 
-def load_all_messages():
-    """Загружает все сообщения из Google Sheets в кэш"""
-    global _messages_cache  # Явно указываем, что будем изменять глобальную переменную
+def _catalog_digest(messages: dict) -> str:
+    payload = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_messages_snapshot(path: str) -> bool:
+    """
+    Загружает каталог из локального снимка и запоминает путь для последующих сохранений.
+    Возвращает True, если снимок найден и прочитан.
+    """
+    global _messages_cache, _messages_digest, _snapshot_path
+    _snapshot_path = path
+    if not path or not os.path.exists(path):
+        logger.info("Локальный снимок сообщений не найден")
+        return False
     try:
-        # Получаем все сообщения из таблицы через get_gsheet_message
-        messages = {}
-        # Список всех ключей, которые мы хотим загрузить
-        keys_to_load = [
-            "welcome_message",
-            "help_message",
-            "socratic_intro",
-            "socratic_initial_question",
-            "completion_message",
-            "final_message",
-            "socratic_error_voice",
-            "socratic_error_processing",
-            "socratic_voice_recognized",
-            "socratic_help",
-            "socratic_timeout"
-        ]
-        
-        for key in keys_to_load:
-            value = get_gsheet_message(key)
-            if value:
-                messages[key] = value
-        
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        messages = snapshot.get('messages', {})
+        if not messages:
+            return False
+        _messages_cache = MappingProxyType(dict(messages))
+        _messages_digest = _catalog_digest(messages)
+        logger.info(f"Загружено {len(messages)} переменных из снимка {path} (сохранён {snapshot.get('saved_at')})")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при чтении снимка сообщений {path}: {e}")
+        return False
+
+def _save_snapshot(messages: dict):
+    """Атомарно сохраняет каталог в файл снимка"""
+    if not _snapshot_path:
+        return
+    tmp_path = f"{_snapshot_path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'saved_at': datetime.now().isoformat(timespec='seconds'), 'messages': messages},
+                f,
+                ensure_ascii=False,
+                indent=1
+            )
+        os.replace(tmp_path, _snapshot_path)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении снимка сообщений {_snapshot_path}: {e}")
+
+async def load_all_messages() -> bool:
+    """
+    Загружает весь каталог сообщений из Google Sheets одним запросом.
+    Возвращает True, если снимок обновился.
+    """
+    global _messages_cache, _messages_digest
+    try:
+        messages = await get_gsheet_messages()
         if not messages:
             logger.warning("Не удалось получить сообщения из таблицы")
-            return
+            return False
+
+        digest = _catalog_digest(messages)
+        if digest == _messages_digest:
+            logger.debug("Каталог сообщений не изменился")
+            return False
+
+        # Атомарно подменяем снимок
+        _messages_cache = MappingProxyType(dict(messages))
+        _messages_digest = digest
+        _save_snapshot(messages)
 
-        # Очищаем кэш перед загрузкой новых данных
-        _messages_cache.clear()
-        
-        # Загружаем сообщения в кэш
-        for key, value in messages.items():
-            _messages_cache[key] = value
-        
         # Логируем все загруженные переменные одним компактным сообщением
         summary = f"Загружено {len(_messages_cache)} переменных: " + ", ".join([
             f"{k}='{(v[:50] + '...' if len(v) > 50 else v)}'" for k, v in _messages_cache.items()
         ])
         logger.info(summary)
+        return True
 
     except Exception as e:
         logger.error(f"Ошибка при загрузке сообщений: {e}")
+        return False
+
+async def run_messages_refresh(interval: float):
+    """Фоновое обновление каталога сообщений раз в ``interval`` секунд"""
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        await load_all_messages()
 
 def get_message(key: str, default: str = None) -> str:
     """Получает сообщение из кэша, переменных окружения или возвращает значение по умолчанию"""
-    global _messages_cache
-    
-    # Если кэш пустой, пробуем загрузить сообщения
-    if not _messages_cache:
-        load_all_messages()
+    messages = _messages_cache
     
+    # Кэш заполняется при старте (load_all_messages), здесь сетевых запросов нет
     # Сначала проверяем кэш
-    if key in _messages_cache:
-        return _messages_cache[key]
+    if key in messages:
+        return messages[key]
     
     # Затем проверяем переменные окружения
     env_key = f"MESSAGE_{key.upper()}"
@@ -81,7 +128,7 @@ def get_message(key: str, default: str = None) -> str:
     
     return default
 
-def debug_messages():
+async def debug_messages():
     """Функция для отладки - показывает откуда загружаются сообщения"""
     print("\n[DEBUG] Система загрузки сообщений:")
     print("1. Google Sheets (приоритет 1)")
@@ -99,8 +146,8 @@ def debug_messages():
         print(f"  - {k}")
     
     # Загружаем сообщения если еще не загружены
-    if _messages_cache is None:
-        load_all_messages()
+    if not _messages_cache:
+        await load_all_messages()
     
     if _messages_cache:
         print("\n[DEBUG] Ключи сообщений из Google Sheets:")
@@ -119,8 +166,8 @@ def debug_messages():
         print(f"  {key}: {value[:50]}... (источник: {source})")
 
 # Функция для принудительной перезагрузки кэша
-def reload_messages():
+async def reload_messages():
     """Принудительно перезагружает сообщения из Google Sheets"""
-    global _messages_cache
-    _messages_cache = None
-    load_all_messages() 
\ No newline at end of file
+    global _messages_digest
+    _messages_digest = None
+    await load_all_messages() 
\ No newline at end of file
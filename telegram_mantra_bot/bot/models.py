@@ -2,31 +2,135 @@
 
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Text, Boolean,
-    ForeignKey, TIMESTAMP, create_engine
+    ForeignKey, Index, TIMESTAMP, event, select, update
 )
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship, sessionmaker, Session
-from .config import load_config
-from datetime import datetime
+from sqlalchemy.orm import Session, relationship
+from .config import Config, load_config
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Optional, Tuple
+from datetime import datetime, timedelta
 
-config = load_config()
+if TYPE_CHECKING:
+    # asyncio extension and dialects are imported on first use to keep import cheap
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its async driver: sqlite -> aiosqlite, postgresql -> asyncpg"""
+    scheme, sep, rest = url.partition('://')
+    if '+' in scheme:
+        dialect, driver = scheme.split('+', 1)
+        if driver in ('aiosqlite', 'asyncpg'):
+            return url
+    else:
+        dialect = scheme
+    if dialect == 'sqlite':
+        return f'sqlite+aiosqlite{sep}{rest}'
+    if dialect in ('postgresql', 'postgres'):
+        return f'postgresql+asyncpg{sep}{rest}'
+    return url
+
+
+def engine_options(url: str, config: Config) -> dict:
+    """Engine profile for the database behind ``url``"""
+    if make_url(url).get_backend_name() == 'sqlite':
+        # One file, one writer at a time: waiting on the lock beats failing with "database is locked"
+        return {'connect_args': {'timeout': config.sqlite_busy_timeout_ms / 1000}}
+    return {
+        'pool_size': config.db_pool_size,
+        'max_overflow': config.db_max_overflow,
+        'pool_timeout': config.db_pool_timeout,
+        'pool_recycle': config.db_pool_recycle,
+        'pool_pre_ping': config.db_pool_pre_ping,
+    }
+
+
+def sqlite_pragmas(url: str, config: Config) -> list:
+    """PRAGMAs applied to every new SQLite connection"""
+    pragmas = [
+        f'PRAGMA synchronous={config.sqlite_synchronous}',
+        f'PRAGMA busy_timeout={config.sqlite_busy_timeout_ms}',
+    ]
+    database = make_url(url).database
+    # WAL and mmap only make sense for a file on disk
+    if database and database != ':memory:':
+        pragmas.insert(0, f'PRAGMA journal_mode={config.sqlite_journal_mode}')
+        pragmas.append(f'PRAGMA mmap_size={config.sqlite_mmap_size}')
+    return pragmas
+
+
+def create_db_engine(database_url: str, config: Config):
+    """
+    Async engine tuned for the database type: SQLite gets WAL with
+    synchronous=NORMAL so readers don't block the writer and commits
+    skip most fsyncs; server databases get a sized, pre-pinged pool.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(database_url)
+    db_engine = create_async_engine(url, echo=False, future=True, **engine_options(url, config))
+    if make_url(url).get_backend_name() == 'sqlite':
+        pragmas = sqlite_pragmas(url, config)
+
+        @event.listens_for(db_engine.sync_engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+    return db_engine
+
+
+# Engine and session factory are built on first use (or by init()), not at import:
+# importing models for Alembic or tooling must not read config or touch the database
+engine = None
+_session_factory = None
+
+
+def init(database_url: str = None, config: Config = None):
+    """Build the engine and session factory. Idempotent; called from main() at startup"""
+    global engine, _session_factory
+    if engine is not None:
+        return engine
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+    config = config or load_config()
+    engine = create_db_engine(database_url or config.database_url, config)
+    # Objects stay usable after commit since sessions are short-lived
+    _session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    user_id_cache.maxsize = config.user_id_cache_size
+    return engine
+
+
+def get_engine():
+    return engine if engine is not None else init()
+
+
+def SessionLocal() -> 'AsyncSession':
+    """New AsyncSession from the lazily created session factory"""
+    if _session_factory is None:
+        init()
+    return _session_factory()
 
-# Create database engine
-engine = create_engine(config.database_url, echo=False, future=True)
 
 # Create declarative base
 Base = declarative_base()
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
     telegram_id = Column(Integer, unique=True, nullable=False)
     username = Column(String(50))
+    first_name = Column(String(100))
+    last_name = Column(String(100))
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    last_active = Column(TIMESTAMP, default=datetime.utcnow)
+    ai_result = Column(Text)
+    # Водяной знак для выгрузки изменённых пользователей в Google Sheets
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     mantras = relationship("Mantra", back_populates="user", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
@@ -43,6 +147,51 @@ class Mantra(Base):
     audio_orders = relationship("AudioOrder", back_populates="mantra", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="mantra")
 
+    # Keyset pagination of a user's mantras walks this index
+    __table_args__ = (
+        Index('ix_mantras_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+
+
+class Topic(Base):
+    """One Socratic dialog of a user"""
+    __tablename__ = 'topics'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    title = Column(Text)
+    current_step = Column(Integer, default=1)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    answers = relationship("Answer", back_populates="topic", cascade="all, delete-orphan")
+
+
+class Answer(Base):
+    """One question/answer turn of a dialog"""
+    __tablename__ = 'answers'
+    id = Column(Integer, primary_key=True)
+    topic_id = Column(Integer, ForeignKey('topics.id', ondelete='CASCADE'), nullable=False)
+    question_index = Column(Integer, nullable=False)
+    question_text = Column(Text)
+    answer_text = Column(Text)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+
+    topic = relationship("Topic", back_populates="answers")
+
+    # Dialog history is read in question order straight from this index
+    __table_args__ = (
+        Index('ix_answers_topic_id_question_index', 'topic_id', 'question_index'),
+    )
+
+
+class FSMRecord(Base):
+    """aiogram FSM state and data of one chat/user, shared by all bot workers"""
+    __tablename__ = 'fsm_storage'
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255))
+    # Compact JSON of the FSM data dict
+    data = Column(Text)
+    expires_at = Column(TIMESTAMP, index=True)
+
 
 class AudioOrder(Base):
     __tablename__ = 'audio_orders'
@@ -64,94 +213,414 @@ class Reminder(Base):
     mantra_id = Column(Integer, ForeignKey('mantras.id', ondelete='SET NULL'))
     remind_at = Column(TIMESTAMP, nullable=False)
     sent = Column(Boolean, default=False)
+    # Lease taken by a dispatcher worker; expired leases are claimed again
+    claimed_at = Column(TIMESTAMP)
     
     user = relationship("User", back_populates="reminders")
     mantra = relationship("Mantra", back_populates="reminders")
 
+    # Due reminders are found by a range scan over this index
+    __table_args__ = (
+        Index('ix_reminders_sent_remind_at', 'sent', 'remind_at'),
+    )
 
-def get_or_create_user(telegram_id: int, username: str = None) -> User:
-    """Get existing user or create new one"""
-    session = SessionLocal()
-    user = session.query(User).filter(User.telegram_id == telegram_id).first()
-    
-    if not user:
-        user = User(telegram_id=telegram_id, username=username)
+
+class UserIdCache:
+    """Bounded LRU map ``telegram_id -> users.id`` so repeat users resolve without queries"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._ids: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int):
+        user_id = self._ids.get(telegram_id)
+        if user_id is None:
+            self.misses += 1
+            return None
+        self._ids.move_to_end(telegram_id)
+        self.hits += 1
+        return user_id
+
+    def put(self, telegram_id: int, user_id: int):
+        self._ids[telegram_id] = user_id
+        self._ids.move_to_end(telegram_id)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def discard(self, telegram_id: int):
+        self._ids.pop(telegram_id, None)
+
+    def clear(self):
+        self._ids.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._ids),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+# Sized from config in init()
+user_id_cache = UserIdCache()
+
+def conflict_insert(dialect_name: str):
+    """Dialect ``insert`` supporting ``ON CONFLICT DO NOTHING / DO UPDATE``, or None"""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+async def resolve_user_id(session: 'AsyncSession', telegram_id: int, **fields) -> int:
+    """
+    ``users.id`` for ``telegram_id``, creating the user if needed.
+    Cached ids cost no queries; otherwise a single
+    ``INSERT ... ON CONFLICT DO NOTHING RETURNING id``, plus a SELECT only
+    when the user already existed (then the id is cached, so that happens
+    once per user and process). ``DO UPDATE`` would save that SELECT but
+    turn every lookup of an existing user into a row write.
+    Runs inside the caller's transaction.
+    """
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+    insert = conflict_insert(session.bind.dialect.name)
+    if insert is not None:
+        user_id = await session.scalar(
+            insert(User)
+            .values(telegram_id=telegram_id, **fields)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            .returning(User.id)
+        )
+        if user_id is not None:
+            # The row only exists once the transaction commits
+            session.info.setdefault('new_user_ids', {})[telegram_id] = user_id
+            return user_id
+    user_id = await session.scalar(select(User.id).where(User.telegram_id == telegram_id))
+    if user_id is None:
+        # Dialect without ON CONFLICT support
+        user = User(telegram_id=telegram_id, **fields)
         session.add(user)
-        session.commit()
-        session.refresh(user)
-    
-    session.close()
-    return user
+        await session.flush()
+        session.info.setdefault('new_user_ids', {})[telegram_id] = user.id
+        return user.id
+    user_id_cache.put(telegram_id, user_id)
+    return user_id
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_new_user_ids(session):
+    for telegram_id, user_id in session.info.pop('new_user_ids', {}).items():
+        user_id_cache.put(telegram_id, user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _drop_new_user_ids(session, previous_transaction):
+    session.info.pop('new_user_ids', None)
+
+
+def forget_user_id(telegram_id: int = None):
+    """Drop cached ids (e.g. after users were deleted); without ``telegram_id`` — all of them"""
+    if telegram_id is None:
+        user_id_cache.clear()
+    else:
+        user_id_cache.discard(telegram_id)
+
+
+async def get_or_create_user(telegram_id: int, username: str = None) -> User:
+    """Get existing user or create new one"""
+    async with SessionLocal() as session:
+        user_id = await resolve_user_id(session, telegram_id, username=username)
+        await session.commit()
+        return await session.get(User, user_id)
+
+
+async def touch_user(telegram_id: int, username: str = None, first_name: str = None, last_name: str = None) -> int:
+    """Create user or refresh profile fields and last activity. Returns ``users.id``"""
+    async with SessionLocal() as session:
+        user_id = await resolve_user_id(session, telegram_id)
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(username=username, first_name=first_name, last_name=last_name, last_active=datetime.utcnow())
+        )
+        await session.commit()
+        return user_id
 
 
-def get_user_mantras(telegram_id: int) -> list:
+async def save_user_ai_result(telegram_id: int, result: str) -> bool:
+    """Store the latest dialog summary for user"""
+    async with SessionLocal() as session:
+        updated = await session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(ai_result=result, last_active=datetime.utcnow())
+        )
+        await session.commit()
+        return updated.rowcount > 0
+
+
+async def get_users_changed_since(after: tuple = None, limit: int = 500) -> list:
+    """
+    Users changed after watermark ``(updated_at, id)``, oldest first.
+    Keyset order makes repeated calls stream all changes without gaps.
+    """
+    async with SessionLocal() as session:
+        query = select(User)
+        if after is not None:
+            updated_at, user_id = after
+            query = query.where(
+                (User.updated_at > updated_at)
+                | ((User.updated_at == updated_at) & (User.id > user_id))
+            )
+        result = await session.scalars(query.order_by(User.updated_at, User.id).limit(limit))
+        return list(result)
+
+
+async def get_user_mantras(telegram_id: int) -> list:
     """Get list of user's mantras"""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.telegram_id == telegram_id).first()
-        if not user:
-            return []
-        return [(m.id, m.text) for m in user.mantras]
-    finally:
-        db.close()
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(Mantra.id, Mantra.text)
+            .join(User, Mantra.user_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(Mantra.id)
+        )
+        return [(mantra_id, text) for mantra_id, text in result]
+
+
+MANTRAS_PAGE_SIZE = 8
+
+
+async def get_user_mantras_page(telegram_id: int, after: Tuple[datetime, int] = None,
+                                before: Tuple[datetime, int] = None, limit: int = MANTRAS_PAGE_SIZE):
+    """
+    One page of user's mantras in ``(created_at, id)`` order, read with a single
+    query over ``ix_mantras_user_id_created_at_id``.
+    ``after`` / ``before`` are ``(created_at, id)`` cursors: the page starts right
+    after / ends right before that row; without them the first page is returned.
+    Returns ``(rows, prev_cursor, next_cursor)`` where rows are ``(id, text, created_at)``
+    and a cursor is None when there is no page in that direction.
+    """
+    query = select(Mantra.id, Mantra.text, Mantra.created_at)
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        query = query.where(Mantra.user_id == user_id)
+    else:
+        query = query.join(User, Mantra.user_id == User.id).where(User.telegram_id == telegram_id)
+
+    backwards = before is not None
+    if backwards:
+        created_at, mantra_id = before
+        query = query.where(
+            (Mantra.created_at < created_at)
+            | ((Mantra.created_at == created_at) & (Mantra.id < mantra_id))
+        ).order_by(Mantra.created_at.desc(), Mantra.id.desc())
+    else:
+        if after is not None:
+            created_at, mantra_id = after
+            query = query.where(
+                (Mantra.created_at > created_at)
+                | ((Mantra.created_at == created_at) & (Mantra.id > mantra_id))
+            )
+        query = query.order_by(Mantra.created_at, Mantra.id)
+
+    async with SessionLocal() as session:
+        # One extra row tells whether there is another page in the walking direction
+        rows = [tuple(row) for row in await session.execute(query.limit(limit + 1))]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return [], None, None
+
+    first = (rows[0][2], rows[0][0])
+    last = (rows[-1][2], rows[-1][0])
+    if backwards:
+        return rows, first if has_more else None, last
+    return rows, first if after is not None else None, last if has_more else None
 
 
-def get_mantra(mantra_id: int):
+async def get_mantra(mantra_id: int):
     """Get mantra by ID"""
-    db = SessionLocal()
-    try:
-        return db.query(Mantra).filter(Mantra.id == mantra_id).first()
-    finally:
-        db.close()
+    async with SessionLocal() as session:
+        return await session.get(Mantra, mantra_id)
 
 
-def save_mantra(telegram_id: int, text: str) -> Mantra:
+async def save_mantra(telegram_id: int, text: str) -> Mantra:
     """Save new mantra for user"""
-    session = SessionLocal()
-    
-    # Get or create user
-    user = session.query(User).filter(User.telegram_id == telegram_id).first()
-    if not user:
-        user = User(telegram_id=telegram_id)
-        session.add(user)
-        session.flush()
-    
-    # Create mantra
-    mantra = Mantra(user_id=user.id, text=text)
-    session.add(mantra)
-    session.commit()
-    session.refresh(mantra)
-    
-    session.close()
-    return mantra
+    async with SessionLocal() as session:
+        # Create mantra
+        mantra = Mantra(user_id=await resolve_user_id(session, telegram_id), text=text)
+        session.add(mantra)
+        await session.commit()
+        return mantra
 
 
-def delete_mantra(mantra_id: int) -> bool:
+async def delete_mantra(mantra_id: int) -> bool:
     """Delete mantra by ID"""
-    db = SessionLocal()
-    try:
-        mantra = db.query(Mantra).filter(Mantra.id == mantra_id).first()
+    async with SessionLocal() as session:
+        mantra = await session.get(Mantra, mantra_id)
         if not mantra:
             return False
-        db.delete(mantra)
-        db.commit()
+        await session.delete(mantra)
+        await session.commit()
         return True
-    finally:
-        db.close()
 
 
-def schedule_reminder(db, telegram_id: int, mantra_id: int, remind_at: datetime):
+async def create_topic(telegram_id: int, title: str = None) -> int:
+    """Start a new dialog for user. Returns ``topics.id``"""
+    async with SessionLocal() as session:
+        topic = Topic(user_id=await resolve_user_id(session, telegram_id), title=title)
+        session.add(topic)
+        await session.commit()
+        return topic.id
+
+
+async def add_answer(topic_id: int, question_index: int, question_text: str, answer_text: str):
+    """Append one dialog turn: a single INSERT whatever the dialog length"""
+    async with SessionLocal() as session:
+        session.add(Answer(
+            topic_id=topic_id,
+            question_index=question_index,
+            question_text=question_text,
+            answer_text=answer_text
+        ))
+        await session.commit()
+
+
+async def get_topic_history(topic_id: int) -> list:
+    """Dialog turns ``(question, answer)`` in question order"""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(Answer.question_text, Answer.answer_text)
+            .where(Answer.topic_id == topic_id)
+            .order_by(Answer.question_index)
+        )
+        return [(question, answer) for question, answer in result]
+
+
+# Called with ``(reminder_id, remind_at)`` after a reminder is committed;
+# the reminder dispatcher hooks in here to put it straight into its timer heap
+on_reminder_scheduled: Optional[Callable[[int, datetime], None]] = None
+
+
+async def schedule_reminder(telegram_id: int, mantra_id: int, remind_at: datetime) -> Reminder:
     """Schedule reminder for mantra"""
-    user = get_or_create_user(telegram_id)
-    reminder = Reminder(
-        user_id=user.id,
-        mantra_id=mantra_id,
-        remind_at=remind_at
-    )
-    db.add(reminder)
-    db.commit()
+    async with SessionLocal() as session:
+        reminder = Reminder(
+            user_id=await resolve_user_id(session, telegram_id),
+            mantra_id=mantra_id,
+            remind_at=remind_at
+        )
+        session.add(reminder)
+        await session.commit()
+    if on_reminder_scheduled:
+        on_reminder_scheduled(reminder.id, reminder.remind_at)
     return reminder
 
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+async def get_upcoming_reminders(until: datetime, lease_seconds: float = 300.0, limit: int = 10000) -> list:
+    """
+    ``(reminder_id, due_at)`` of unsent reminders due up to ``until``, soonest first.
+    For a reminder leased by a worker ``due_at`` is when that lease expires.
+    """
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(Reminder.id, Reminder.remind_at, Reminder.claimed_at)
+            .where(Reminder.sent == False, Reminder.remind_at <= until)
+            .order_by(Reminder.remind_at)
+            .limit(limit)
+        )
+        lease = timedelta(seconds=lease_seconds)
+        return [
+            (reminder_id, max(remind_at, claimed_at + lease) if claimed_at else remind_at)
+            for reminder_id, remind_at, claimed_at in result
+        ]
+
+
+async def claim_due_reminders(now: datetime = None, limit: int = 500, lease_seconds: float = 300.0) -> list:
+    """
+    Claim up to ``limit`` due, unsent reminders for this worker and return
+    ``(reminder_id, telegram_id, mantra_text)`` tuples, oldest first.
+
+    A single ``UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)``
+    stamps ``claimed_at``: on Postgres concurrent workers skip each other's
+    rows, on SQLite the statement is atomic anyway. Rows whose lease is older
+    than ``lease_seconds`` (a worker died mid-batch or delivery failed) are
+    claimed again, so the lease doubles as the retry delay.
+    """
+    now = now or datetime.utcnow()
+    lease_expired = now - timedelta(seconds=lease_seconds)
+    due = (
+        select(Reminder.id)
+        .where(
+            Reminder.sent == False,
+            Reminder.remind_at <= now,
+            (Reminder.claimed_at == None) | (Reminder.claimed_at < lease_expired),
+        )
+        .order_by(Reminder.remind_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with SessionLocal() as session:
+        claimed = await session.scalars(
+            update(Reminder)
+            .where(Reminder.id.in_(due))
+            .values(claimed_at=now)
+            .returning(Reminder.id)
+            .execution_options(synchronize_session=False)
+        )
+        ids = list(claimed)
+        if not ids:
+            await session.commit()
+            return []
+        result = await session.execute(
+            select(Reminder.id, User.telegram_id, Mantra.text)
+            .join(User, Reminder.user_id == User.id)
+            .outerjoin(Mantra, Reminder.mantra_id == Mantra.id)
+            .where(Reminder.id.in_(ids))
+            .order_by(Reminder.remind_at)
+        )
+        rows = [tuple(row) for row in result]
+        await session.commit()
+        return rows
+
+
+async def mark_reminders_sent(reminder_ids: list) -> int:
+    """Mark reminders delivered in one statement"""
+    if not reminder_ids:
+        return 0
+    async with SessionLocal() as session:
+        result = await session.execute(
+            update(Reminder)
+            .where(Reminder.id.in_(reminder_ids))
+            .values(sent=True)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return result.rowcount
+
+
+async def init_db():
+    """Create all tables"""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def close_db():
+    """Dispose connection pool"""
+    global engine, _session_factory
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+        _session_factory = None
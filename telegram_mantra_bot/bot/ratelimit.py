@@ -0,0 +1,86 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import List, Optional, Tuple
+
+# Приоритеты ожидания: меньше — раньше
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket с приоритетной очередью ожидания.
+
+    ``rate`` — скорость пополнения (токенов в секунду), ``capacity`` — размер
+    всплеска. Если токенов нет, вызывающий ждёт; при освобождении токена
+    первым его получает ожидающий с наименьшим приоритетом (затем — FIFO).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+        # Сколько раз вызывающему пришлось ждать токен и сколько он ждал в сумме
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def per_minute(cls, limit: int, burst: Optional[int] = None) -> 'TokenBucket':
+        return cls(rate=limit / 60.0, capacity=burst if burst is not None else limit)
+
+    @property
+    def depth(self) -> int:
+        """Количество ожидающих токен"""
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL):
+        """Дождаться и забрать один токен"""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        started = time.monotonic()
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await future
+        finally:
+            self.wait_seconds += time.monotonic() - started
+
+    async def _pump(self):
+        """Раздаёт токены ожидающим по мере пополнения"""
+        while self._waiters:
+            self._refill()
+            while self._waiters and self._tokens >= 1:
+                _, _, future = heapq.heappop(self._waiters)
+                # Ожидающего могли отменить — токен ему не нужен
+                if future.done():
+                    continue
+                self._tokens -= 1
+                future.set_result(None)
+            if self._waiters:
+                await asyncio.sleep(max((1 - self._tokens) / self.rate, 0.001))
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            'tokens': round(self._tokens, 2),
+            'queue_depth': self.depth,
+            'throttled': self.throttled,
+            'wait_seconds': round(self.wait_seconds, 3),
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from .messages import get_message
+from . import models
+from .models import claim_due_reminders, get_upcoming_reminders, mark_reminders_sent
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderDispatcher:
+    """
+    Фоновая рассылка напоминаний.
+
+    Пачками забирает наступившие напоминания (``claim_due_reminders`` ставит
+    на них аренду, поэтому несколько воркеров не отправят одно и то же),
+    рассылает их с ограничением скорости Telegram и одним запросом помечает
+    отправленными. Пока пачки приходят полными, следующая берётся сразу —
+    так разгребается и пик в десятки тысяч напоминаний на одну минуту.
+
+    Когда идти в БД, решает таймерная куча: в неё загружаются только
+    напоминания ближайшего окна (``window_seconds``), рассыльщик спит ровно
+    до ближайшего срока, а окно перечитывается раз в ``refill_interval``.
+    Новые напоминания ``models.schedule_reminder`` кладёт в кучу сразу.
+    """
+
+    # Попыток отправить одно сообщение, если Telegram просит подождать
+    MAX_ATTEMPTS = 3
+
+    # Пауза после ошибки БД, чтобы не крутиться в цикле
+    ERROR_DELAY = 5.0
+
+    def __init__(self, bot, batch_size: int = 500, window_seconds: float = 900.0, refill_interval: float = 300.0,
+                 lease_seconds: float = 300.0, messages_per_second: float = 25.0, concurrency: int = 20,
+                 window_limit: int = 10000):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.window_seconds = window_seconds
+        self.refill_interval = refill_interval
+        self.lease_seconds = lease_seconds
+        self.window_limit = window_limit
+        # Таймерная куча (срок, id) напоминаний из загруженного окна
+        self._heap: List[Tuple[datetime, int]] = []
+        self._queued = set()
+        self._window_end: Optional[datetime] = None
+        self._next_refill = 0.0
+        self._wakeup = asyncio.Event()
+        # Общий лимит бота на отправку сообщений
+        self.bucket = TokenBucket(rate=messages_per_second, capacity=messages_per_second)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.metrics = {
+            'batches': 0,
+            'refills': 0,
+            'wakeups': 0,
+            'sent': 0,
+            'undeliverable': 0,
+            'retried': 0,
+            'flood_waits': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'last_batch_seconds': 0.0,
+        }
+
+    async def dispatch_once(self) -> int:
+        """Забирает и рассылает одну пачку. Возвращает её размер."""
+        batch = await claim_due_reminders(limit=self.batch_size, lease_seconds=self.lease_seconds)
+        if not batch:
+            return 0
+        started = time.monotonic()
+        done, retry = [], []
+
+        async def deliver(reminder_id: int, chat_id: int, mantra_text: Optional[str]):
+            async with self._semaphore:
+                delivered = await self._send(chat_id, mantra_text)
+            (done if delivered else retry).append(reminder_id)
+
+        await asyncio.gather(*(deliver(*row) for row in batch))
+        # Не доставленные из-за временных ошибок остаются за нами до истечения аренды,
+        # после чего их заберёт следующий проход — это и есть пауза перед повтором
+        await mark_reminders_sent(done)
+        retry_at = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        for reminder_id in retry:
+            self.push(reminder_id, retry_at)
+
+        elapsed = time.monotonic() - started
+        self.metrics['batches'] += 1
+        self.metrics['retried'] += len(retry)
+        self.metrics['last_batch_size'] = len(batch)
+        self.metrics['last_batch_seconds'] = elapsed
+        logger.info(f"Напоминания: отправлено {len(done)} из {len(batch)} за {elapsed:.1f}с")
+        return len(batch)
+
+    async def _send(self, chat_id: int, mantra_text: Optional[str]) -> bool:
+        """
+        Отправляет одно напоминание. ``True`` — напоминание закрыто (доставлено
+        или доставить его невозможно), ``False`` — стоит повторить позже.
+        """
+        text = get_message("reminder_message", "🔔 Напоминание о вашей мантре")
+        if mantra_text:
+            text = f"{text}\n\n{mantra_text}"
+        for _ in range(self.MAX_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+            except TelegramRetryAfter as e:
+                self.metrics['flood_waits'] += 1
+                logger.warning(f"Telegram просит подождать {e.retry_after}с перед отправкой напоминания")
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или чат удалён — повтор не поможет
+                self.metrics['undeliverable'] += 1
+                logger.info(f"Напоминание для {chat_id} не доставлено: {e}")
+                return True
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error(f"Ошибка отправки напоминания для {chat_id}: {e}")
+                return False
+            self.metrics['sent'] += 1
+            return True
+        return False
+
+    # --- Таймерная куча ---
+    def push(self, reminder_id: int, due_at: datetime):
+        """Кладёт напоминание в кучу, если оно попадает в загруженное окно (иначе его подхватит перечитывание)"""
+        if self._window_end is None or due_at > self._window_end or reminder_id in self._queued:
+            return
+        heapq.heappush(self._heap, (due_at, reminder_id))
+        self._queued.add(reminder_id)
+        # Новый ближайший срок — будим цикл, чтобы он пересчитал сон
+        if self._heap[0][1] == reminder_id:
+            self._wakeup.set()
+
+    async def refill(self):
+        """Перечитывает окно ближайших напоминаний одним запросом"""
+        until = datetime.utcnow() + timedelta(seconds=self.window_seconds)
+        upcoming = await get_upcoming_reminders(until, lease_seconds=self.lease_seconds, limit=self.window_limit)
+        if len(upcoming) >= self.window_limit:
+            # Окно не поместилось целиком — сужаем его до последнего загруженного
+            until = upcoming[-1][1]
+        self._heap = [(due_at, reminder_id) for reminder_id, due_at in upcoming]
+        heapq.heapify(self._heap)
+        self._queued = {reminder_id for reminder_id, _ in upcoming}
+        self._window_end = until
+        self._next_refill = time.monotonic() + self.refill_interval
+        self.metrics['refills'] += 1
+
+    def _pop_due(self, now: datetime) -> int:
+        popped = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            self._queued.discard(reminder_id)
+            popped += 1
+        return popped
+
+    def _sleep_seconds(self) -> float:
+        delay = self._next_refill - time.monotonic()
+        if self._heap:
+            delay = min(delay, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+        return max(delay, 0.0)
+
+    async def run(self):
+        """Фоновый цикл: спит до ближайшего срока из кучи, затем рассылает наступившие"""
+        logger.info(f"Рассылка напоминаний запущена (пачка {self.batch_size}, окно {self.window_seconds}с)")
+        models.on_reminder_scheduled = self.push
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    if time.monotonic() >= self._next_refill:
+                        await self.refill()
+                    if self._pop_due(datetime.utcnow()):
+                        self.metrics['wakeups'] += 1
+                        # Полная пачка — значит, есть ещё наступившие напоминания
+                        while await self.dispatch_once() >= self.batch_size:
+                            pass
+                        continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.metrics['errors'] += 1
+                    logger.error(f"Ошибка рассылки напоминаний: {e}")
+                    await asyncio.sleep(self.ERROR_DELAY)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._sleep_seconds())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if models.on_reminder_scheduled == self.push:
+                models.on_reminder_scheduled = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'heap_size': len(self._heap),
+            'next_due_at': self._heap[0][0].isoformat() if self._heap else None,
+            'rate_limiter': self.bucket.stats(),
+        }
+# Глобальный экземпляр рассыльщика
+reminder_dispatcher = None
+
+async def run_reminder_dispatcher(bot, batch_size: int = 500, window_seconds: float = 900.0,
+                                  refill_interval: float = 300.0, lease_seconds: float = 300.0,
+                                  messages_per_second: float = 25.0, concurrency: int = 20):
+    """Фоновая задача рассылки напоминаний"""
+    global reminder_dispatcher
+    reminder_dispatcher = ReminderDispatcher(
+        bot,
+        batch_size=batch_size,
+        window_seconds=window_seconds,
+        refill_interval=refill_interval,
+        lease_seconds=lease_seconds,
+        messages_per_second=messages_per_second,
+        concurrency=concurrency,
+    )
+    await reminder_dispatcher.run()
@@ -0,0 +1,189 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, exists, select
+
+from .models import Answer, AudioOrder, Mantra, Reminder, SessionLocal, Topic
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """Что архивировать: строки ``model`` старше ``days`` дней по колонке ``age_column``"""
+    name: str
+    model: Any
+    age_column: Any
+    days: float
+    conditions: List[Any] = field(default_factory=list)
+
+
+def default_policies(reminders_days: float = 30.0, dialogs_days: float = 180.0,
+                     audio_orders_days: float = 0.0, mantras_days: float = 0.0) -> List[RetentionPolicy]:
+    """
+    Политики хранения по умолчанию. Порядок важен: сначала зависимые строки
+    (ответы, заказы озвучки), затем родительские — родитель уходит в архив,
+    только когда на него больше ничего не ссылается.
+    """
+    return [
+        RetentionPolicy('reminders', Reminder, Reminder.remind_at, reminders_days, [Reminder.sent == True]),
+        RetentionPolicy('answers', Answer, Answer.created_at, dialogs_days),
+        RetentionPolicy('topics', Topic, Topic.created_at, dialogs_days, [
+            ~exists().where(Answer.topic_id == Topic.id),
+        ]),
+        RetentionPolicy('audio_orders', AudioOrder, AudioOrder.ordered_at, audio_orders_days, [
+            AudioOrder.status != 'pending',
+        ]),
+        RetentionPolicy('mantras', Mantra, Mantra.created_at, mantras_days, [
+            ~exists().where(Reminder.mantra_id == Mantra.id),
+            ~exists().where(AudioOrder.mantra_id == Mantra.id),
+        ]),
+    ]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class RetentionJob:
+    """
+    Фоновая архивация устаревших данных.
+
+    Для каждой политики строки старше срока хранения забираются порциями по
+    ``chunk_size``: порция дописывается в сжатый архив
+    ``<archive_dir>/<таблица>/<ГГГГ-ММ>.jsonl.gz`` и только затем удаляется
+    из БД одной короткой транзакцией. Между порциями — пауза
+    ``chunk_pause``, чтобы не мешать живому боту. Срок 0 — хранить вечно.
+
+    Архивы — обычные файлы и для SQLite, и для PostgreSQL: таблицы бота не
+    секционированы, а порционное удаление даёт тот же эффект без миграции.
+    """
+
+    def __init__(self, policies: List[RetentionPolicy], archive_dir: str = 'archive',
+                 chunk_size: int = 500, chunk_pause: float = 0.2, interval: float = 86400.0):
+        self.policies = policies
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.interval = interval
+        self.metrics = {
+            'runs': 0,
+            'chunks': 0,
+            'errors': 0,
+            'reclaimed': {policy.name: 0 for policy in policies},
+            'last_run_reclaimed': {},
+            'last_run_at': None,
+            'last_run_seconds': 0.0,
+        }
+
+    def archive_path(self, name: str, now: Optional[datetime] = None) -> str:
+        now = now or datetime.utcnow()
+        return os.path.join(self.archive_dir, name, f"{now:%Y-%m}.jsonl.gz")
+
+    def _write_archive(self, name: str, rows: List[Dict[str, Any]]):
+        """Дописывает порцию в gzip-архив (каждая порция — отдельный gzip-член файла)"""
+        path = self.archive_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for row in rows:
+                    line = json.dumps(row, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+                    archive.write(line.encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    async def archive_chunk(self, policy: RetentionPolicy, cutoff: datetime) -> int:
+        """Архивирует и удаляет одну порцию. Возвращает число строк."""
+        table = policy.model.__table__
+        async with SessionLocal() as session:
+            rows = (await session.execute(
+                select(table)
+                .where(policy.age_column < cutoff, *policy.conditions)
+                .order_by(table.c.id)
+                .limit(self.chunk_size)
+            )).mappings().all()
+            if not rows:
+                return 0
+            rows = [dict(row) for row in rows]
+            # Сначала архив, потом удаление: при сбое между ними строка
+            # окажется в архиве дважды, но не потеряется
+            await asyncio.to_thread(self._write_archive, policy.name, rows)
+            await session.execute(delete(table).where(table.c.id.in_([row['id'] for row in rows])))
+            await session.commit()
+        self.metrics['chunks'] += 1
+        return len(rows)
+
+    async def run_once(self) -> Dict[str, int]:
+        """Один проход по всем политикам. Возвращает число убранных строк по таблицам."""
+        started = time.monotonic()
+        now = datetime.utcnow()
+        reclaimed: Dict[str, int] = {}
+        for policy in self.policies:
+            if policy.days <= 0:
+                continue
+            cutoff = now - timedelta(days=policy.days)
+            total = 0
+            while True:
+                count = await self.archive_chunk(policy, cutoff)
+                total += count
+                if count < self.chunk_size:
+                    break
+                await asyncio.sleep(self.chunk_pause)
+            reclaimed[policy.name] = total
+            self.metrics['reclaimed'][policy.name] += total
+            if total:
+                logger.info(f"Архивация: {policy.name} — перенесено в архив строк: {total}")
+
+        self.metrics['runs'] += 1
+        self.metrics['last_run_reclaimed'] = reclaimed
+        self.metrics['last_run_at'] = time.time()
+        self.metrics['last_run_seconds'] = time.monotonic() - started
+        return reclaimed
+
+    async def run(self):
+        """Фоновый цикл архивации"""
+        logger.info(f"Архивация устаревших данных запущена (интервал {self.interval}с, порция {self.chunk_size})")
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error(f"Ошибка архивации устаревших данных: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'reclaimed_total': sum(self.metrics['reclaimed'].values()),
+        }
+
+
+# Глобальный экземпляр архиватора
+retention_job = None
+
+async def run_retention(interval: float = 86400.0, chunk_size: int = 500, chunk_pause: float = 0.2,
+                        archive_dir: str = 'archive', reminders_days: float = 30.0, dialogs_days: float = 180.0,
+                        audio_orders_days: float = 0.0, mantras_days: float = 0.0):
+    """Фоновая задача архивации устаревших данных"""
+    global retention_job
+    if interval <= 0:
+        return
+    retention_job = RetentionJob(
+        default_policies(reminders_days, dialogs_days, audio_orders_days, mantras_days),
+        archive_dir=archive_dir,
+        chunk_size=chunk_size,
+        chunk_pause=chunk_pause,
+        interval=interval,
+    )
+    await retention_job.run()
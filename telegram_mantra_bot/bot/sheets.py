@@ -1,38 +1,67 @@
 from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from typing import List, Dict, Any
 import os
 import logging
 import json
 from datetime import datetime
+from .config import load_config
+from .sheets_queue import SheetsWriteQueue
+from .sheets_index import UsersSheetIndex
+from .sheets_http import AsyncSheetsApi
 
 logger = logging.getLogger(__name__)
 
 # Константы для работы с Google Sheets
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 SPREADSHEET_ID = os.getenv('GOOGLE_SHEETS_ID')
-USERS_RANGE = 'Users!A1:Z'  # Для гибкой работы с колонками
+USERS_RANGE = 'Users'  # Весь лист — работает при любом количестве колонок
+# Журнал диалогов: одна строка на пару вопрос/ответ, только дописывание.
+# Лист создаётся при запуске очереди записи, если его нет (см. ensure_dialogs_sheet)
+DIALOGS_SHEET = 'Dialogs'
+DIALOGS_HEADERS = ['user_id', 'session_id', 'index', 'question', 'answer', 'created_at']
+DIALOGS_RANGE = f'{DIALOGS_SHEET}!A1:F'
 G_CRED = 'cred2.json'
 
 class GoogleSheetsClient:
-    def __init__(self):
+    """
+    Асинхронный клиент Google Sheets: все запросы идут через общий пул
+    HTTP-соединений и не блокируют event loop aiogram.
+    """
+    def __init__(self, flush_interval: float = 2.0, flush_max_batch: int = 200, index_revalidate_interval: float = 300.0,
+                 timeout: float = 15.0, max_connections: int = 20, reads_per_minute: int = 60,
+                 writes_per_minute: int = 60, max_retries: int = 5, api: AsyncSheetsApi = None):
         try:
-            credentials = Credentials.from_service_account_file(
-                G_CRED,
-                scopes=SCOPES
+            # Готовый api передают бенчмарки и тесты (например, поверх tests/fake_sheets.py)
+            self.api = api or AsyncSheetsApi(
+                SPREADSHEET_ID,
+                credentials=Credentials.from_service_account_file(G_CRED, scopes=SCOPES),
+                timeout=timeout,
+                max_connections=max_connections,
+                reads_per_minute=reads_per_minute,
+                writes_per_minute=writes_per_minute,
+                max_retries=max_retries
             )
-            self.service = build('sheets', 'v4', credentials=credentials)
-            self.sheet = self.service.spreadsheets()
         except Exception as e:
             logger.error(f"Failed to initialize Google Sheets client: {e}")
             raise
+        # Все записи идут через write-behind очередь
+        self.write_queue = SheetsWriteQueue(
+            self.api,
+            flush_interval=flush_interval,
+            max_batch=flush_max_batch
+        )
+        # Индекс user_id -> номер строки, чтобы не скачивать весь лист Users
+        self.users_index = UsersSheetIndex(
+            self.api,
+            revalidate_interval=index_revalidate_interval
+        )
+        self.write_queue.on_row_appended = self.users_index.add
+        # Журнал диалогов выключается, если листа Dialogs нет и создать его не удалось
+        self.dialogs_enabled = True
 
-    def get_all_messages(self) -> Dict[str, str]:
+    async def get_all_messages(self) -> Dict[str, str]:
         try:
-            result = self.sheet.values().get(
-                spreadsheetId=SPREADSHEET_ID,
-                range='keys!A2:C'
-            ).execute()
+            result = await self.api.values_get('keys!A2:C')
             values = result.get('values', [])
             return {row[0]: row[1] for row in values if len(row) >= 2}
         except Exception as e:
@@ -40,17 +69,39 @@ class GoogleSheetsClient:
             return {}
 
     # --- Гибкая работа с Users ---
-    def get_users_headers_and_rows(self):
-        result = self.sheet.values().get(
-            spreadsheetId=SPREADSHEET_ID,
-            range=USERS_RANGE
-        ).execute()
-        values = result.get('values', [])
-        if not values:
+    async def get_users_headers_and_rows(self, columns: List[str] = None):
+        """
+        Заголовки и строки листа Users. С ``columns`` читаются только эти колонки
+        (одним batchGet), и строки содержат значения в порядке ``columns``.
+        """
+        if columns is None:
+            result = await self.api.values_get(USERS_RANGE)
+            values = result.get('values', [])
+            if not values:
+                return [], []
+            headers = values[0]
+            rows = values[1:]
+            return headers, rows
+
+        index = self.users_index
+        await index.ensure_loaded()
+        columns = [c for c in columns if index.column_index(c) != -1]
+        if not columns:
             return [], []
-        headers = values[0]
-        rows = values[1:]
-        return headers, rows
+        result = await self.api.values_batch_get(
+            [index.column_range(c) for c in columns],
+            majorDimension='COLUMNS'
+        )
+        column_values = []
+        for value_range in result.get('valueRanges', []):
+            values = value_range.get('values', [])
+            column_values.append(values[0] if values else [])
+        height = max((len(v) for v in column_values), default=0)
+        rows = [
+            [v[i] if i < len(v) else '' for v in column_values]
+            for i in range(height)
+        ]
+        return columns, rows
 
     def get_column_index(self, headers, column_name):
         try:
@@ -58,143 +109,122 @@ class GoogleSheetsClient:
         except ValueError:
             return -1
 
-    def add_or_update_user(self, user: dict):
-        headers, rows = self.get_users_headers_and_rows()
-        if not headers:
-            logger.error("Users sheet is missing headers!")
-            return False
-        user_id_idx = self.get_column_index(headers, 'user_id')
-        if user_id_idx == -1:
-            logger.error("No 'user_id' column in Users sheet!")
-            return False
-        user_ids = [row[user_id_idx] for row in rows if len(row) > user_id_idx]
-        now = datetime.now().strftime('%Y-%m-%d %H:%M')
-        if str(user['user_id']) in user_ids:
-            idx = user_ids.index(str(user['user_id']))
-            row_num = idx + 2
-            updates = {}
-            for field in ['last_active', 'username', 'first_name', 'last_name']:
-                col_idx = self.get_column_index(headers, field)
-                if col_idx != -1:
-                    col_letter = chr(ord('A') + col_idx)
-                    value = now if field == 'last_active' else user.get(field, '')
-                    updates[field] = (col_letter, value)
-            for field, (col_letter, value) in updates.items():
-                self.sheet.values().update(
-                    spreadsheetId=SPREADSHEET_ID,
-                    range=f'Users!{col_letter}{row_num}',
-                    valueInputOption='RAW',
-                    body={'values': [[value]]}
-                ).execute()
-        else:
-            row = [''] * len(headers)
-            for k, v in user.items():
-                idx = self.get_column_index(headers, k)
-                if idx != -1:
-                    row[idx] = v
-            started_at_idx = self.get_column_index(headers, 'started_at')
-            last_active_idx = self.get_column_index(headers, 'last_active')
-            if started_at_idx != -1:
-                row[started_at_idx] = now
-            if last_active_idx != -1:
-                row[last_active_idx] = now
-            self.sheet.values().append(
-                spreadsheetId=SPREADSHEET_ID,
-                range=USERS_RANGE,
-                valueInputOption='RAW',
-                insertDataOption='INSERT_ROWS',
-                body={'values': [row]}
-            ).execute()
-        return True
-
-    def save_questions_block(self, user_id: int, questions_and_answers: list):
-        headers, rows = self.get_users_headers_and_rows()
-        if not headers:
-            logger.error("Users sheet is missing headers!")
-            return False
-        user_id_idx = self.get_column_index(headers, 'user_id')
-        col_idx = self.get_column_index(headers, 'questions')
-        if user_id_idx == -1 or col_idx == -1:
-            logger.error("No 'user_id' or 'questions' column in Users sheet!")
-            return False
-        user_ids = [row[user_id_idx] for row in rows if len(row) > user_id_idx]
-        block = "\n".join([f"{q}:\n{a}" for q, a in questions_and_answers])
-        if str(user_id) in user_ids:
-            idx = user_ids.index(str(user_id))
-            row_num = idx + 2
-            col_letter = chr(ord('A') + col_idx)
-            # Получаем текущее значение и дописываем
-            try:
-                current = rows[idx][col_idx] if len(rows[idx]) > col_idx else ''
-            except Exception:
-                current = ''
-            new_block = (current + '\n' if current else '') + block
-            self.sheet.values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f'Users!{col_letter}{row_num}',
-                valueInputOption='RAW',
-                body={'values': [[new_block]]}
-            ).execute()
+    async def ensure_dialogs_sheet(self) -> bool:
+        """
+        Проверяет, что в таблице есть лист журнала диалогов, и создаёт его с
+        заголовками, если нет. Иначе запись в несуществующий лист получала бы
+        400 на каждом сбросе очереди. Если лист так и не появился, журнал
+        выключается; при временной ошибке проверки остаётся включённым.
+        """
+        try:
+            titles = await self.api.sheet_titles()
+        except Exception as e:
+            logger.warning(f"Не удалось проверить лист {DIALOGS_SHEET}: {e}")
+            return self.dialogs_enabled
+        if DIALOGS_SHEET in titles:
             return True
-        else:
-            logger.error(f"User {user_id} not found in Users sheet!")
-            return False
+        try:
+            await self.api.add_sheet(DIALOGS_SHEET)
+            await self.api.values_update(f'{DIALOGS_SHEET}!A1:F1', [DIALOGS_HEADERS])
+            logger.info(f"Создан лист {DIALOGS_SHEET} для журнала диалогов")
+        except Exception as e:
+            self.dialogs_enabled = False
+            logger.warning(f"Листа {DIALOGS_SHEET} нет и создать его не удалось, журнал диалогов выключен: {e}")
+        return self.dialogs_enabled
 
-    def save_ai_result(self, user_id: int, result: str):
-        headers, rows = self.get_users_headers_and_rows()
-        if not headers:
-            logger.error("Users sheet is missing headers!")
-            return False
-        user_id_idx = self.get_column_index(headers, 'user_id')
-        col_idx = self.get_column_index(headers, 'ai_result')
-        if user_id_idx == -1 or col_idx == -1:
-            logger.error("No 'user_id' or 'ai_result' column in Users sheet!")
-            return False
-        user_ids = [row[user_id_idx] for row in rows if len(row) > user_id_idx]
-        if str(user_id) in user_ids:
-            idx = user_ids.index(str(user_id))
-            row_num = idx + 2
-            col_letter = chr(ord('A') + col_idx)
-            self.sheet.values().update(
-                spreadsheetId=SPREADSHEET_ID,
-                range=f'Users!{col_letter}{row_num}',
-                valueInputOption='RAW',
-                body={'values': [[result]]}
-            ).execute()
-            return True
-        else:
-            logger.error(f"User {user_id} not found in Users sheet!")
+    def save_dialog_turn(self, user_id: int, session_id: str, index: int, question: str, answer: str):
+        """
+        Дописывает одну пару вопрос/ответ в журнал диалогов.
+        Ничего не читает из таблицы, поэтому стоимость записи не зависит от длины диалога.
+        """
+        if not self.dialogs_enabled:
             return False
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.write_queue.append_row(
+            f'dialog:{session_id}:{index}',
+            DIALOGS_RANGE,
+            [str(user_id), session_id, index, question or '', answer or '', now]
+        )
+        return True
 
 # Глобальный экземпляр клиента
 sheets_client = None
 
 def init_sheets_client():
     global sheets_client
+    config = load_config()
     try:
-        sheets_client = GoogleSheetsClient()
+        sheets_client = GoogleSheetsClient(
+            flush_interval=config.sheets_flush_interval,
+            flush_max_batch=config.sheets_flush_max_batch,
+            index_revalidate_interval=config.sheets_index_revalidate_interval,
+            timeout=config.sheets_timeout,
+            max_connections=config.sheets_max_connections,
+            reads_per_minute=config.sheets_reads_per_minute,
+            writes_per_minute=config.sheets_writes_per_minute,
+            max_retries=config.sheets_max_retries
+        )
         return True
     except Exception as e:
         logger.error(f"Failed to initialize Google Sheets client: {e}")
         return False
 
-def get_message(message_key: str) -> str:
+async def get_message(message_key: str) -> str:
     if not sheets_client:
         return None
-    messages = sheets_client.get_all_messages()
+    messages = await sheets_client.get_all_messages()
     return messages.get(message_key)
 
-def add_or_update_user(user: dict):
+async def get_all_messages() -> Dict[str, str]:
     if not sheets_client:
-        return False
-    return sheets_client.add_or_update_user(user)
+        return {}
+    return await sheets_client.get_all_messages()
 
-def save_questions_block(user_id: int, questions_and_answers: list):
+def save_dialog_turn(user_id: int, session_id: str, index: int, question: str, answer: str):
     if not sheets_client:
         return False
-    return sheets_client.save_questions_block(user_id, questions_and_answers)
+    return sheets_client.save_dialog_turn(user_id, session_id, index, question, answer)
 
-def save_ai_result(user_id: int, result: str):
+async def run_write_queue():
+    """Фоновая задача, выгружающая очередь записей в Google Sheets"""
     if not sheets_client:
-        return False
-    return sheets_client.save_ai_result(user_id, result) 
\ No newline at end of file
+        return
+    # До первого сброса: строки журнала не должны уходить в несуществующий лист
+    await sheets_client.ensure_dialogs_sheet()
+    await sheets_client.write_queue.run()
+
+def stop_write_queue():
+    if sheets_client:
+        sheets_client.write_queue.stop()
+
+def invalidate_users_index(user_id: int = None):
+    """
+    Сбросить индекс листа Users (например, после ручной правки таблицы).
+    С ``user_id`` — только строку этого пользователя.
+    """
+    if not sheets_client:
+        return
+    if user_id is None:
+        sheets_client.users_index.invalidate()
+    else:
+        sheets_client.users_index.invalidate_user(user_id)
+
+async def flush_writes() -> int:
+    """Принудительно выгрузить очередь записей"""
+    if not sheets_client:
+        return 0
+    return await sheets_client.write_queue.flush()
+
+async def close_sheets_client():
+    """Закрыть пул HTTP-соединений"""
+    if sheets_client:
+        await sheets_client.api.aclose()
+
+def get_sheets_stats() -> dict:
+    """Метрики очереди записей (сбросы, бэклог) и лимитера запросов (глубина очереди, троттлинг, повторы)"""
+    if not sheets_client:
+        return {}
+    return {
+        'write_queue': sheets_client.write_queue.stats(),
+        'api': sheets_client.api.stats(),
+    }
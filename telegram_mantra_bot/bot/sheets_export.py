@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import sheets
+from .models import User, get_users_changed_since
+from .ratelimit import PRIORITY_LOW
+
+logger = logging.getLogger(__name__)
+
+
+def _fmt_time(value: Optional[datetime]) -> str:
+    return value.strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+# Колонки листа Users, которые принадлежат БД; остальные колонки (заметки команды и т.п.) не трогаем
+EXPORTED_COLUMNS: Dict[str, Callable[[User], Any]] = {
+    'user_id': lambda u: str(u.telegram_id),
+    'username': lambda u: u.username or '',
+    'first_name': lambda u: u.first_name or '',
+    'last_name': lambda u: u.last_name or '',
+    'started_at': lambda u: _fmt_time(u.created_at),
+    'last_active': lambda u: _fmt_time(u.last_active),
+    'ai_result': lambda u: u.ai_result or '',
+}
+
+
+class UsersSheetExporter:
+    """
+    Фоновая выгрузка пользователей из БД в лист Users.
+
+    БД — основной источник данных; хендлеры пишут только в неё. Экспортёр
+    периодически забирает строки, изменённые после водяного знака
+    ``(updated_at, id)``, и пачками отправляет их через write-behind очередь.
+
+    ``updated_at`` проставляет приложение до коммита, поэтому транзакция,
+    закоммиченная позже соседних, может появиться уже позади водяного знака.
+    Каждая выгрузка заново просматривает окно ``lag`` секунд перед ним;
+    строки, уже выгруженные с тем же ``updated_at``, повторно не отправляются.
+    Транзакции длиннее ``lag`` по-прежнему могут потеряться до полной сверки
+    при следующем старте.
+    """
+
+    def __init__(self, client, interval: float = 30.0, batch_size: int = 500, lag: float = 60.0):
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lag = timedelta(seconds=lag)
+        # None — первая выгрузка после старта сверяет всех пользователей
+        self.watermark: Optional[Tuple[datetime, int]] = None
+        # Выгруженные версии строк в окне перекрытия: users.id -> updated_at
+        self._exported: Dict[int, datetime] = {}
+        self.metrics = {
+            'runs': 0,
+            'users_exported': 0,
+            'users_rescanned': 0,
+            'rows_appended': 0,
+            'errors': 0,
+            'last_run_at': None,
+            'last_run_seconds': 0.0,
+        }
+
+    async def export_once(self) -> int:
+        """Выгружает все изменения после водяного знака. Возвращает число пользователей."""
+        index = self.client.users_index
+        queue = self.client.write_queue
+        await index.ensure_loaded()
+        if index.column_index('user_id') == -1:
+            logger.error("No 'user_id' column in Users sheet!")
+            return 0
+
+        started = time.monotonic()
+        exported = 0
+        cursor = (self.watermark[0] - self.lag, 0) if self.watermark else None
+        while True:
+            users = await get_users_changed_since(cursor, self.batch_size)
+            if not users:
+                break
+            fresh = [u for u in users if u.updated_at is None or self._exported.get(u.id) != u.updated_at]
+            await self.export_users(fresh)
+            for user in fresh:
+                self._exported[user.id] = user.updated_at
+            self.metrics['users_rescanned'] += len(users) - len(fresh)
+            cursor = (users[-1].updated_at, users[-1].id)
+            if cursor[0] is not None and (self.watermark is None or cursor > self.watermark):
+                self.watermark = cursor
+            exported += len(fresh)
+            # Не раздуваем очередь больше пары пакетов — даём ей выгрузиться
+            while queue.backlog() >= queue.max_batch * 2:
+                await asyncio.sleep(queue.flush_interval)
+            if len(users) < self.batch_size:
+                break
+
+        if self.watermark:
+            # За окном перекрытия версии строк больше не сравниваются
+            horizon = self.watermark[0] - self.lag
+            self._exported = {
+                user_id: updated_at for user_id, updated_at in self._exported.items()
+                if updated_at is not None and updated_at >= horizon
+            }
+
+        self.metrics['runs'] += 1
+        self.metrics['users_exported'] += exported
+        self.metrics['last_run_at'] = time.time()
+        self.metrics['last_run_seconds'] = time.monotonic() - started
+        if exported:
+            logger.info(f"Выгружено в Google Sheets пользователей: {exported}")
+        return exported
+
+    async def export_users(self, users):
+        """Ставит в очередь записи строки ``users``: новые — дописываются, известные — обновляются по ячейкам"""
+        for user in users:
+            await self._export_user(user)
+
+    async def _export_user(self, user: User):
+        index = self.client.users_index
+        queue = self.client.write_queue
+        key = str(user.telegram_id)
+        values = {column: fn(user) for column, fn in EXPORTED_COLUMNS.items()}
+
+        pending = queue.pending_row(key)
+        if pending is not None:
+            for column, value in values.items():
+                idx = index.column_index(column)
+                if idx != -1 and idx < len(pending):
+                    pending[idx] = value
+            return
+
+        row_num = await index.row_for(key)
+        if row_num is not None:
+            for column, value in values.items():
+                if column == 'user_id':
+                    continue
+                a1 = index.cell(column, row_num)
+                if a1:
+                    queue.set_cell(a1, value, priority=PRIORITY_LOW)
+            return
+
+        row = [''] * len(index.headers)
+        for column, value in values.items():
+            idx = index.column_index(column)
+            if idx != -1:
+                row[idx] = value
+        queue.append_row(key, sheets.USERS_RANGE, row)
+        self.metrics['rows_appended'] += 1
+
+    async def run(self):
+        """Фоновый цикл выгрузки"""
+        logger.info(f"Выгрузка пользователей в Google Sheets запущена (интервал {self.interval}с)")
+        while True:
+            try:
+                await self.export_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error(f"Ошибка выгрузки пользователей в Google Sheets: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'watermark': self.watermark[0].isoformat() if self.watermark and self.watermark[0] else None,
+        }
+
+
+# Глобальный экземпляр экспортёра
+users_exporter = None
+
+async def run_users_export(interval: float = 30.0, batch_size: int = 500, lag: float = 60.0):
+    """Фоновая задача выгрузки пользователей из БД в Google Sheets"""
+    global users_exporter
+    if not sheets.sheets_client:
+        return
+    users_exporter = UsersSheetExporter(sheets.sheets_client, interval=interval, batch_size=batch_size, lag=lag)
+    await users_exporter.run()
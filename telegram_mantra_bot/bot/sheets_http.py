@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from .ratelimit import TokenBucket, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+SHEETS_API_URL = 'https://sheets.googleapis.com/v4/spreadsheets/'
+
+# Ответы, которые имеет смысл повторить: превышение квоты и ошибки сервера
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+# --- A1-нотация ---
+def column_letter(index: int) -> str:
+    """Буквенное имя колонки по индексу с нуля: 0 -> A, 25 -> Z, 26 -> AA, 702 -> AAA"""
+    if index < 0:
+        raise ValueError(f"Column index must be non-negative, got {index}")
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def quote_sheet_name(sheet_name: str) -> str:
+    """Имя листа для A1-диапазона: с пробелами и спецсимволами берётся в кавычки"""
+    if sheet_name.replace('_', '').isalnum():
+        return sheet_name
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def a1_cell(sheet_name: str, col_idx: int, row_num: int) -> str:
+    """Одна ячейка: ``Users!AB12``"""
+    return f'{quote_sheet_name(sheet_name)}!{column_letter(col_idx)}{row_num}'
+
+
+def a1_column(sheet_name: str, col_idx: int, first_row: int = 1) -> str:
+    """Колонка целиком, начиная со строки ``first_row``: ``Users!AB2:AB``"""
+    letter = column_letter(col_idx)
+    return f'{quote_sheet_name(sheet_name)}!{letter}{first_row}:{letter}'
+
+
+class SheetsApiError(Exception):
+    """Ошибка ответа Sheets API"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"Sheets API {status_code}: {message}")
+        self.status_code = status_code
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Стоит ли повторить запрос позже. Отказ API с кодом 4xx (кроме 429) постоянный:
+    тот же запрос снова получит его. Квота, ошибки сервера и сети — временные.
+    """
+    if isinstance(error, SheetsApiError):
+        return error.status_code in RETRYABLE_STATUSES
+    return True
+
+
+class AsyncSheetsApi:
+    """
+    Асинхронная обёртка над ``spreadsheets.values`` Sheets API v4.
+
+    Работает поверх одного ``httpx.AsyncClient`` с пулом keep-alive соединений,
+    поэтому запросы разных пользователей идут параллельно и не блокируют event loop.
+
+    Каждый запрос проходит через token bucket с отдельными бюджетами на чтение
+    и запись (квоты Sheets API считаются в минуту), а ответы 429/5xx
+    повторяются с экспоненциальной задержкой и джиттером.
+    """
+
+    def __init__(self, spreadsheet_id: str, credentials=None, timeout: float = 15.0,
+                 max_connections: int = 20, reads_per_minute: int = 60, writes_per_minute: int = 60,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 32.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.credentials = credentials
+        self.read_bucket = TokenBucket.per_minute(reads_per_minute)
+        self.write_bucket = TokenBucket.per_minute(writes_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._token_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            base_url=SHEETS_API_URL,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            # Подменяется в тестах и бенчмарках (см. tests/fake_sheets.py)
+            transport=transport,
+        )
+        self.metrics = {
+            'calls': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'server_errors': 0,
+            'transport_errors': 0,
+            'failed': 0,
+        }
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            async with self._token_lock:
+                if not self.credentials.valid:
+                    # google-auth обновляет токен синхронно — уводим это из event loop
+                    from google.auth.transport.requests import Request
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        return {'Authorization': f'Bearer {self.credentials.token}'}
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Экспоненциальная задержка с полным джиттером, но не меньше Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def request(self, method: str, path: str, params: Optional[dict] = None,
+                      json: Optional[dict] = None, priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        """``path`` — относительно таблицы: ``values/...``, ``:batchUpdate`` или пустой для метаданных"""
+        bucket = self.read_bucket if method == 'GET' else self.write_bucket
+        # './' — иначе httpx принял бы '<id>:batchUpdate' за схему URL
+        url = f'./{self.spreadsheet_id}' + (path if not path or path.startswith(':') else f'/{path}')
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire(priority)
+            headers = await self._auth_headers()
+            started = time.monotonic()
+            retry_after = None
+            try:
+                response = await self._http.request(
+                    method,
+                    url,
+                    params=params,
+                    json=json,
+                    headers=headers,
+                )
+            except httpx.TransportError as e:
+                self.metrics['transport_errors'] += 1
+                error = e
+            else:
+                self.metrics['calls'] += 1
+                logger.debug(f"Sheets API {method} {path}: {response.status_code} за {time.monotonic() - started:.2f}с")
+                if response.status_code < 400:
+                    return response.json() if response.content else {}
+                error = SheetsApiError(response.status_code, response.text[:500])
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.metrics['failed'] += 1
+                    raise error
+                if response.status_code == 429:
+                    self.metrics['rate_limited'] += 1
+                else:
+                    self.metrics['server_errors'] += 1
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            self.metrics['retries'] += 1
+            logger.warning(f"Sheets API {method} {path}: {error}; повтор через {delay:.1f}с")
+            await asyncio.sleep(delay)
+
+        self.metrics['failed'] += 1
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            'read': self.read_bucket.stats(),
+            'write': self.write_bucket.stats(),
+        }
+
+    # --- spreadsheets ---
+    async def sheet_titles(self, priority: int = PRIORITY_NORMAL) -> List[str]:
+        """Названия листов таблицы"""
+        result = await self.request('GET', '', params={'fields': 'sheets.properties.title'}, priority=priority)
+        return [sheet.get('properties', {}).get('title') for sheet in result.get('sheets', [])]
+
+    async def add_sheet(self, title: str, priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        """Добавляет пустой лист ``title``"""
+        return await self.request(
+            'POST',
+            ':batchUpdate',
+            json={'requests': [{'addSheet': {'properties': {'title': title}}}]},
+            priority=priority,
+        )
+
+    # --- spreadsheets.values ---
+    async def values_get(self, a1_range: str, priority: int = PRIORITY_NORMAL, **params) -> Dict[str, Any]:
+        return await self.request('GET', f'values/{quote(a1_range)}', params=params or None, priority=priority)
+
+    async def values_batch_get(self, ranges: List[str], priority: int = PRIORITY_NORMAL, **params) -> Dict[str, Any]:
+        return await self.request('GET', 'values:batchGet', params={'ranges': ranges, **params}, priority=priority)
+
+    async def values_update(self, a1_range: str, values: List[List[Any]], priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        return await self.request(
+            'PUT',
+            f'values/{quote(a1_range)}',
+            params={'valueInputOption': 'RAW'},
+            json={'range': a1_range, 'values': values},
+            priority=priority,
+        )
+
+    async def values_append(self, a1_range: str, values: List[List[Any]], priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        return await self.request(
+            'POST',
+            f'values/{quote(a1_range)}:append',
+            params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+            json={'values': values},
+            priority=priority,
+        )
+
+    async def values_batch_update(self, data: List[Dict[str, Any]], priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
+        return await self.request(
+            'POST',
+            'values:batchUpdate',
+            json={'valueInputOption': 'RAW', 'data': data},
+            priority=priority,
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from .sheets_http import a1_cell, a1_column, column_letter, quote_sheet_name
+
+logger = logging.getLogger(__name__)
+
+
+class UsersSheetIndex:
+    """
+    Индекс листа Users: карта заголовков и ``user_id -> номер строки``.
+
+    Строится один раз и дополняется при добавлении строк. Так как таблицу
+    могут править руками, колонка ``user_id`` периодически перечитывается
+    (только она, без остальных данных), а ``invalidate()`` принудительно
+    сбрасывает индекс вместе с заголовками.
+    """
+
+    def __init__(self, api, sheet_name: str = 'Users', revalidate_interval: float = 300.0):
+        self.api = api
+        self.sheet_name = sheet_name
+        self.revalidate_interval = revalidate_interval
+
+        self._lock = asyncio.Lock()
+        self.headers: List[str] = []
+        self._columns: Dict[str, int] = {}
+        self._rows: Dict[str, int] = {}
+        # Строки, добавленные, пока колонка user_id перечитывалась
+        self._added_during_read: Dict[str, int] = {}
+        self._validated_at: Optional[float] = None
+        self._stale = False
+
+    # --- Заголовки ---
+    def column_index(self, column_name: str) -> int:
+        """Индекс колонки по заголовку (индекс должен быть загружен через ``ensure_loaded``)"""
+        return self._columns.get(column_name, -1)
+
+    def column_letter(self, column_name: str) -> Optional[str]:
+        idx = self.column_index(column_name)
+        if idx == -1:
+            return None
+        return column_letter(idx)
+
+    def cell(self, column_name: str, row_num: int) -> Optional[str]:
+        """A1-адрес ячейки колонки ``column_name`` в строке ``row_num`` (или None, если колонки нет)"""
+        idx = self.column_index(column_name)
+        if idx == -1:
+            return None
+        return a1_cell(self.sheet_name, idx, row_num)
+
+    def column_range(self, column_name: str, first_row: int = 2) -> Optional[str]:
+        """A1-диапазон колонки ``column_name`` без заголовка"""
+        idx = self.column_index(column_name)
+        if idx == -1:
+            return None
+        return a1_column(self.sheet_name, idx, first_row)
+
+    # --- Строки ---
+    async def row_for(self, user_id, refresh_on_miss: bool = False) -> Optional[int]:
+        """
+        Номер строки пользователя или ``None``.
+        ``refresh_on_miss`` перечитывает колонку user_id, если пользователь не найден
+        (на случай, если строку добавили руками).
+        """
+        await self.ensure_loaded()
+        key = str(user_id)
+        row_num = self._rows.get(key)
+        if row_num is None and refresh_on_miss:
+            await self.revalidate()
+            row_num = self._rows.get(key)
+        return row_num
+
+    def add(self, user_id, row_num: int):
+        """Регистрирует только что добавленную строку"""
+        self._rows[str(user_id)] = row_num
+        if self._lock.locked():
+            self._added_during_read[str(user_id)] = row_num
+
+    def invalidate_user(self, user_id):
+        """Забывает строку одного пользователя — она будет найдена заново при следующей проверке"""
+        self._rows.pop(str(user_id), None)
+        self._stale = True
+
+    def invalidate(self):
+        """Полностью сбрасывает индекс, включая заголовки"""
+        self.headers = []
+        self._columns = {}
+        self._rows = {}
+        self._validated_at = None
+
+    # --- Загрузка ---
+    async def ensure_loaded(self):
+        if self._validated_at is None:
+            await self.load()
+        elif self._stale or time.monotonic() - self._validated_at > self.revalidate_interval:
+            await self.revalidate()
+
+    async def load(self):
+        """Читает строку заголовков и колонку user_id"""
+        async with self._lock:
+            # Пока ждали блокировку, индекс мог загрузить другой хендлер
+            if self._validated_at is not None:
+                return
+            result = await self.api.values_get(f'{quote_sheet_name(self.sheet_name)}!1:1')
+            values = result.get('values', [])
+            headers = values[0] if values else []
+            self.headers = headers
+            self._columns = {name: idx for idx, name in enumerate(headers)}
+            if not headers:
+                logger.error(f"{self.sheet_name} sheet is missing headers!")
+            await self._read_user_ids()
+
+    async def revalidate(self):
+        """Перечитывает только колонку user_id и перестраивает карту строк"""
+        started = time.monotonic()
+        async with self._lock:
+            # Кто-то уже перечитал колонку, пока мы ждали
+            if self._validated_at is not None and self._validated_at >= started:
+                return
+            await self._read_user_ids()
+
+    async def _read_user_ids(self):
+        self._added_during_read = {}
+        user_id_idx = self._columns.get('user_id', -1)
+        if user_id_idx == -1:
+            self._rows = {}
+            self._validated_at = time.monotonic()
+            self._stale = False
+            return
+        result = await self.api.values_get(
+            a1_column(self.sheet_name, user_id_idx, first_row=2),
+            majorDimension='COLUMNS'
+        )
+        values = result.get('values', [])
+        column = values[0] if values else []
+        rows = {}
+        for offset, value in enumerate(column):
+            if value != '':
+                # При дубликатах оставляем первую строку, как и прежний поиск через list.index()
+                rows.setdefault(str(value), offset + 2)
+        rows.update(self._added_during_read)
+        self._added_during_read = {}
+        self._rows = rows
+        self._validated_at = time.monotonic()
+        self._stale = False
+        logger.debug(f"Индекс {self.sheet_name} перестроен: {len(rows)} пользователей")
+
+    def __len__(self):
+        return len(self._rows)
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .ratelimit import PRIORITY_HIGH, PRIORITY_NORMAL
+from .sheets_http import column_letter, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+# 'Users!A12:F14' -> 12
+_UPDATED_RANGE_ROW = re.compile(r'![A-Z]+(\d+)')
+
+
+class SheetsWriteQueue:
+    """
+    Write-behind очередь для Google Sheets.
+
+    Хендлеры только кладут изменения в очередь и сразу возвращаются.
+    Накопленные изменения всех пользователей отправляются одним
+    ``values.batchUpdate`` (и одним ``values.append`` на каждый лист)
+    по таймеру или при достижении порога размера.
+
+    У каждой ячейки есть приоритет: приоритетные записи (например, итог ИИ)
+    будят очередь сразу и уходят первыми, если бэклог больше одного пакета,
+    а фоновые (``last_active``) ждут своей очереди.
+
+    Каждый лист добавляется отдельным запросом, а ячейки пишутся, даже если
+    добавление строк не удалось. При временной ошибке (квота, 5xx, сеть)
+    изменения возвращаются в очередь; постоянный отказ (4xx) не исправится
+    повтором — такие изменения отбрасываются с записью в лог и в метрики,
+    иначе одна плохая строка навсегда заблокировала бы очередь.
+    """
+
+    def __init__(self, api, flush_interval: float = 2.0, max_batch: int = 200):
+        self.api = api
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        # Ожидающие обновления ячеек: A1-диапазон -> значение (последняя запись выигрывает)
+        self._cells: Dict[str, Any] = {}
+        self._priorities: Dict[str, int] = {}
+        # Ожидающие новые строки: ключ -> (диапазон листа, строка)
+        self._rows: Dict[str, Tuple[str, List[Any]]] = {}
+        # Строки, которые уже отправлены, но ответ ещё не получен
+        self._inflight: Dict[str, List[Any]] = {}
+        self._first_pending_at: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+
+        self._wakeup = asyncio.Event()
+        self._stopped = False
+
+        # Колбэк, вызываемый после добавления строки: (ключ, номер строки)
+        self.on_row_appended: Optional[Callable[[str, int], None]] = None
+
+        self.metrics = {
+            'flushes': 0,
+            'flush_errors': 0,
+            'dropped_cells': 0,
+            'dropped_rows': 0,
+            'cells_written': 0,
+            'rows_appended': 0,
+            'api_calls': 0,
+            'last_flush_at': None,
+            'last_flush_seconds': 0.0,
+            'last_flush_size': 0,
+        }
+
+    # --- Постановка в очередь ---
+    def set_cell(self, a1_range: str, value: Any, priority: int = PRIORITY_NORMAL):
+        """Запланировать запись значения в ячейку"""
+        self._cells[a1_range] = value
+        self._priorities[a1_range] = min(priority, self._priorities.get(a1_range, priority))
+        self._mark_pending(urgent=priority <= PRIORITY_HIGH)
+
+    def append_row(self, key: str, sheet_range: str, row: List[Any]):
+        """Запланировать добавление новой строки; ``key`` — идентификатор строки (например, user_id)"""
+        self._rows[key] = (sheet_range, row)
+        self._mark_pending()
+
+    def pending_row(self, key: str) -> Optional[List[Any]]:
+        """
+        Строка, ещё не записанная в таблицу (в очереди или в полёте).
+        Возвращённый список можно менять на месте — изменения попадут в таблицу.
+        """
+        if key in self._rows:
+            return self._rows[key][1]
+        return self._inflight.get(key)
+
+    def pending_cell(self, a1_range: str, default: Any = None) -> Any:
+        """Значение ячейки, ожидающее записи"""
+        return self._cells.get(a1_range, default)
+
+    def backlog(self) -> int:
+        return len(self._cells) + len(self._rows)
+
+    def _mark_pending(self, urgent: bool = False):
+        if self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+        if urgent or self.backlog() >= self.max_batch:
+            self._wakeup.set()
+
+    def _take_cells(self) -> Tuple[Dict[str, Any], Dict[str, int]]:
+        """Забирает из очереди не больше ``max_batch`` ячеек, начиная с приоритетных"""
+        if len(self._cells) <= self.max_batch:
+            cells, priorities = self._cells, self._priorities
+            self._cells, self._priorities = {}, {}
+            return cells, priorities
+        ordered = sorted(self._cells, key=lambda a1: self._priorities.get(a1, PRIORITY_NORMAL))
+        cells, priorities = {}, {}
+        for a1 in ordered[:self.max_batch]:
+            cells[a1] = self._cells.pop(a1)
+            priorities[a1] = self._priorities.pop(a1, PRIORITY_NORMAL)
+        return cells, priorities
+
+    # --- Отправка ---
+    async def flush(self) -> int:
+        """Отправить всё накопленное. Возвращает количество записанных ячеек и строк."""
+        async with self._flush_lock:
+            cells, priorities = self._take_cells()
+            rows = self._rows
+            self._rows = {}
+            self._first_pending_at = time.monotonic() if self._cells else None
+            if not cells and not rows:
+                return 0
+
+            # Запоминаем копии отправленных строк, чтобы потом найти изменения «в полёте»
+            sent_rows = {key: list(row) for key, (_, row) in rows.items()}
+            for key, (_, row) in rows.items():
+                self._inflight[key] = row
+
+            started = time.monotonic()
+            try:
+                written = await self._append_rows(rows, sent_rows)
+                if cells:
+                    written += await self._write_cells(cells, priorities)
+            finally:
+                for key in rows:
+                    self._inflight.pop(key, None)
+
+            elapsed = time.monotonic() - started
+            self.metrics['flushes'] += 1
+            self.metrics['last_flush_at'] = time.time()
+            self.metrics['last_flush_seconds'] = elapsed
+            self.metrics['last_flush_size'] = written
+            logger.info(f"Google Sheets: записано {written} изменений за {elapsed:.2f}с")
+            if self._cells and len(self._cells) >= self.max_batch:
+                # Остаток не поместился в пакет — не ждём следующего тика
+                self._wakeup.set()
+            return written
+
+    def _failed(self, error: Exception, what: str, count: int, dropped_metric: str) -> bool:
+        """Учитывает ошибку записи. True — изменения надо вернуть в очередь, False — они отброшены."""
+        self.metrics['flush_errors'] += 1
+        if is_retryable_error(error):
+            logger.error(f"Ошибка при записи в Google Sheets ({what}), повторим позже: {error}")
+            return True
+        self.metrics[dropped_metric] += count
+        logger.error(f"Google Sheets отклонил запись ({what}), отброшено изменений: {count}: {error}")
+        return False
+
+    async def _write_cells(self, cells: Dict[str, Any], priorities: Dict[str, int]) -> int:
+        """Пишет ячейки одним ``values.batchUpdate``; при временной ошибке возвращает их в очередь"""
+        try:
+            await self.api.values_batch_update(
+                [{'range': a1, 'values': [[value]]} for a1, value in cells.items()],
+                priority=min(priorities.values())
+            )
+        except Exception as e:
+            if self._failed(e, f"{len(cells)} ячеек", len(cells), 'dropped_cells'):
+                self._requeue(cells, priorities, {})
+            return 0
+        self.metrics['api_calls'] += 1
+        self.metrics['cells_written'] += len(cells)
+        return len(cells)
+
+    async def _append_rows(self, rows: Dict[str, Tuple[str, List[Any]]], sent_rows: Dict[str, List[Any]]) -> int:
+        """
+        Добавляет новые строки одним запросом на лист и догоняет изменения, сделанные во время отправки.
+        Ошибка на одном листе не мешает остальным: его строки возвращаются в очередь или отбрасываются.
+        """
+        by_range: Dict[str, List[str]] = {}
+        for key, (sheet_range, _) in rows.items():
+            by_range.setdefault(sheet_range, []).append(key)
+
+        appended = 0
+        for sheet_range, keys in by_range.items():
+            try:
+                response = await self.api.values_append(sheet_range, [sent_rows[key] for key in keys])
+            except Exception as e:
+                if self._failed(e, f"строки {sheet_range}", len(keys), 'dropped_rows'):
+                    self._requeue({}, {}, {key: rows[key] for key in keys})
+                continue
+            self.metrics['api_calls'] += 1
+            self.metrics['rows_appended'] += len(keys)
+            appended += len(keys)
+
+            first_row = self._first_row_number(response)
+            sheet_name = sheet_range.split('!')[0]
+            for offset, key in enumerate(keys):
+                self._inflight.pop(key, None)
+                if first_row is None:
+                    continue
+                row_num = first_row + offset
+                current = rows[key][1]
+                # Строку могли изменить, пока она была «в полёте» — дописываем разницу ячейками
+                for col_idx, value in enumerate(current):
+                    sent = sent_rows[key][col_idx] if col_idx < len(sent_rows[key]) else ''
+                    if value != sent:
+                        self.set_cell(f'{sheet_name}!{column_letter(col_idx)}{row_num}', value)
+                if self.on_row_appended:
+                    self.on_row_appended(key, row_num)
+        return appended
+
+    @staticmethod
+    def _first_row_number(response: dict) -> Optional[int]:
+        updated_range = (response or {}).get('updates', {}).get('updatedRange', '')
+        match = _UPDATED_RANGE_ROW.search(updated_range)
+        return int(match.group(1)) if match else None
+
+    def _requeue(self, cells: Dict[str, Any], priorities: Dict[str, int], rows: Dict[str, Tuple[str, List[Any]]]):
+        """Возвращает неотправленные изменения в очередь, не затирая более свежие"""
+        for a1, value in cells.items():
+            if a1 not in self._cells:
+                self._cells[a1] = value
+                self._priorities[a1] = priorities.get(a1, PRIORITY_NORMAL)
+        for key, item in rows.items():
+            self._rows.setdefault(key, item)
+        # Повтор — по обычному таймеру, чтобы не крутиться в цикле при недоступном API
+        if (self._cells or self._rows) and self._first_pending_at is None:
+            self._first_pending_at = time.monotonic()
+
+    # --- Фоновая задача ---
+    async def run(self):
+        """Фоновый цикл: сбрасывает очередь по таймеру или по порогу размера"""
+        self._stopped = False
+        logger.info(f"Очередь записи в Google Sheets запущена (интервал {self.flush_interval}с, порог {self.max_batch})")
+        try:
+            while not self._stopped:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+        finally:
+            # Не теряем хвост при остановке
+            await self.flush()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики очереди: сбросы, объём и возраст невыгруженного бэклога"""
+        oldest = self._first_pending_at
+        return {
+            **self.metrics,
+            'pending_cells': len(self._cells),
+            'pending_rows': len(self._rows),
+            'pending_high_priority': sum(1 for p in self._priorities.values() if p <= PRIORITY_HIGH),
+            'backlog_age_seconds': (time.monotonic() - oldest) if oldest is not None else 0.0,
+        }
@@ -5,6 +5,7 @@
 
 import sys
 import os
+import asyncio
 from pathlib import Path
 
 # Добавляем корневую директорию проекта в путь
@@ -15,7 +16,7 @@ sys.path.insert(0, project_root)
 from telegram_mantra_bot.bot.sheets import init_sheets_client
 from telegram_mantra_bot.bot.messages import debug_messages, get_message, reload_messages
 
-def main():
+async def main():
     print("🧪 Тестирование системы загрузки сообщений")
     print("=" * 50)
     
@@ -29,7 +30,7 @@ def main():
     
     # Запускаем отладку
     print("\n2. Отладочная информация:")
-    debug_messages()
+    await debug_messages()
     
     # Тестируем конкретные сообщения
     print("\n3. Тестирование конкретных сообщений:")
@@ -47,10 +48,10 @@ def main():
     
     # Тестируем перезагрузку
     print("\n4. Тестирование перезагрузки кэша:")
-    reload_messages()
+    await reload_messages()
     print("✅ Кэш перезагружен")
     
     print("\n🎯 Тестирование завершено!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main()) 
\ No newline at end of file
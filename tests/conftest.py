@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Тесты импортируют пакет бота и tests.fake_sheets из корня репозитория
+project_root = str(Path(__file__).resolve().parent.parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
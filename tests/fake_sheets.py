@@ -0,0 +1,237 @@
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import httpx
+
+from telegram_mantra_bot.bot.sheets_http import column_letter, quote_sheet_name
+
+# 'Users!AB2:AB', "'My sheet'!1:1", 'keys!A2:C', 'Users'
+_A1_RANGE = re.compile(r"^(?:'((?:[^']|'')+)'|([^!]+))(?:!([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?)?$")
+
+
+def column_index(letters: str) -> int:
+    """Индекс колонки с нуля по буквенному имени: A -> 0, AA -> 26"""
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index - 1
+
+
+def parse_a1(a1_range: str) -> Tuple[str, int, int, Optional[int], Optional[int]]:
+    """
+    Разбирает A1-диапазон в ``(лист, первая строка, первая колонка, последняя строка, последняя колонка)``.
+    Индексы с нуля, ``None`` — диапазон открыт до конца листа.
+    """
+    match = _A1_RANGE.match(a1_range)
+    if not match:
+        raise ValueError(f"Bad A1 range: {a1_range}")
+    quoted, plain, col1, row1, col2, row2 = match.groups()
+    sheet = quoted.replace("''", "'") if quoted else plain
+    first_row = int(row1) - 1 if row1 else 0
+    first_col = column_index(col1) if col1 else 0
+    if col2 is None and row2 is None:
+        # Одна ячейка ('A5'), строка ('5') или колонка ('A')
+        last_row = first_row if row1 else None
+        last_col = first_col if col1 else None
+    else:
+        last_row = int(row2) - 1 if row2 else None
+        last_col = column_index(col2) if col2 else None
+    return sheet, first_row, first_col, last_row, last_col
+
+
+class FakeSheetsServer:
+    """
+    Поддельный Sheets API v4 в памяти процесса для тестов и бенчмарков.
+
+    Подключается к ``AsyncSheetsApi`` через ``transport`` и отвечает на
+    ``values.get``, ``values:batchGet``, ``values.update``, ``values:append``
+    и ``values:batchUpdate``, а также на чтение названий листов и ``addSheet``. Задержка ответа и ошибки квоты настраиваются:
+    ``latency`` (+ случайный ``jitter``) имитирует сеть, ``quota_per_minute``
+    отвечает 429 при превышении поминутной квоты, как настоящий API,
+    а ``error_rate`` — доля случайных 429/503. Для тестов ``fail_next``
+    заранее назначает ошибки конкретному типу запроса.
+    """
+
+    def __init__(self, sheets: Optional[Dict[str, List[List[Any]]]] = None, latency: float = 0.0,
+                 jitter: float = 0.0, quota_per_minute: Optional[int] = None, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.sheets: Dict[str, List[List[Any]]] = {name: [list(row) for row in rows] for name, rows in (sheets or {}).items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_per_minute = quota_per_minute
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._recent: deque = deque()
+        # Счётчики по типу запроса: 'get', 'batchGet', 'update', 'append', 'batchUpdate', 'metadata', 'addSheet'
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        # Назначенные ошибки по типу запроса: тип -> очередь статусов
+        self._planned_errors: Dict[str, deque] = {}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.errors.clear()
+
+    def fail_next(self, kind: str, status: int = 503, times: int = 1):
+        """Следующие ``times`` запросов типа ``kind`` ('append', 'batchUpdate', ...) получат ``status``"""
+        self._planned_errors.setdefault(kind, deque()).extend([status] * times)
+
+    @staticmethod
+    def request_kind(request: httpx.Request) -> str:
+        """Тип запроса: 'get', 'batchGet', 'update', 'append', 'batchUpdate', 'metadata' или 'addSheet'"""
+        path = unquote(request.url.path)
+        if '/values' not in path:
+            return 'addSheet' if path.endswith(':batchUpdate') else 'metadata'
+        tail = path.split('/values', 1)[1]
+        if tail in (':batchGet', ':batchUpdate'):
+            return tail[1:]
+        if request.method == 'POST' and tail.endswith(':append'):
+            return 'append'
+        if request.method == 'PUT':
+            return 'update'
+        return 'get'
+
+    # --- Данные ---
+    def read(self, a1_range: str) -> List[List[Any]]:
+        sheet, first_row, first_col, last_row, last_col = parse_a1(a1_range)
+        rows = self.sheets.get(sheet, [])
+        end_row = len(rows) if last_row is None else min(last_row + 1, len(rows))
+        values = []
+        for row in rows[first_row:end_row]:
+            end_col = len(row) if last_col is None else last_col + 1
+            values.append(list(row[first_col:end_col]))
+        # Как и настоящий API, не возвращаем пустые хвосты
+        values = [self._rstrip(row) for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, a1_range: str, values: List[List[Any]]):
+        sheet, first_row, first_col, _, _ = parse_a1(a1_range)
+        rows = self.sheets.setdefault(sheet, [])
+        for offset, row_values in enumerate(values):
+            row_idx = first_row + offset
+            while len(rows) <= row_idx:
+                rows.append([])
+            row = rows[row_idx]
+            needed = first_col + len(row_values)
+            if len(row) < needed:
+                row.extend([''] * (needed - len(row)))
+            row[first_col:needed] = row_values
+
+    def append(self, a1_range: str, values: List[List[Any]]) -> str:
+        """Добавляет строки после последней непустой, возвращает updatedRange"""
+        sheet, _, first_col, _, _ = parse_a1(a1_range)
+        rows = self.sheets.setdefault(sheet, [])
+        while rows and not any(v != '' for v in rows[-1]):
+            rows.pop()
+        start = len(rows)
+        for row_values in values:
+            rows.append([''] * first_col + list(row_values))
+        width = max((len(v) for v in values), default=1)
+        return (f'{quote_sheet_name(sheet)}!{column_letter(first_col)}{start + 1}:'
+                f'{column_letter(first_col + max(width, 1) - 1)}{start + len(values)}')
+
+    @staticmethod
+    def _rstrip(row: List[Any]) -> List[Any]:
+        while row and row[-1] == '':
+            row.pop()
+        return row
+
+    @staticmethod
+    def _by_dimension(values: List[List[Any]], major_dimension: Optional[str]) -> List[List[Any]]:
+        if major_dimension != 'COLUMNS' or not values:
+            return values
+        width = max(len(row) for row in values)
+        columns = [[row[i] if i < len(row) else '' for row in values] for i in range(width)]
+        return [FakeSheetsServer._rstrip(column) for column in columns]
+
+    # --- HTTP ---
+    def _quota_exceeded(self) -> bool:
+        if self.quota_per_minute is None:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if len(self._recent) >= self.quota_per_minute:
+            return True
+        self._recent.append(now)
+        return False
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self._quota_exceeded():
+            self.errors[429] += 1
+            return httpx.Response(429, json={'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED'}},
+                                  headers={'Retry-After': '1'})
+        planned = self._planned_errors.get(self.request_kind(request))
+        if planned:
+            status = planned.popleft()
+            self.errors[status] += 1
+            return httpx.Response(status, json={'error': {'code': status}})
+        if self.error_rate and self._random.random() < self.error_rate:
+            status = self._random.choice([429, 503])
+            self.errors[status] += 1
+            return httpx.Response(status, json={'error': {'code': status}})
+
+        # /v4/spreadsheets/<id>/values/<range>[:append] или /values:batchGet
+        path = unquote(request.url.path)
+        params = request.url.params
+        body = json.loads(request.content) if request.content else {}
+        kind = self.request_kind(request)
+        if kind == 'metadata':
+            self.calls['metadata'] += 1
+            return httpx.Response(200, json={'sheets': [{'properties': {'title': name}} for name in self.sheets]})
+        if kind == 'addSheet':
+            self.calls['addSheet'] += 1
+            for item in body.get('requests', []):
+                title = item['addSheet']['properties']['title']
+                if title in self.sheets:
+                    return httpx.Response(400, json={'error': {'code': 400, 'message': f'Sheet {title} already exists'}})
+                self.sheets[title] = []
+            return httpx.Response(200, json={'replies': [{} for _ in body.get('requests', [])]})
+        tail = path.split('/values', 1)[1]
+
+        if tail == ':batchGet':
+            self.calls['batchGet'] += 1
+            major = params.get('majorDimension')
+            return httpx.Response(200, json={'valueRanges': [
+                {'range': a1, 'values': self._by_dimension(self.read(a1), major)}
+                for a1 in params.get_list('ranges')
+            ]})
+        if tail == ':batchUpdate':
+            self.calls['batchUpdate'] += 1
+            for item in body.get('data', []):
+                self.write(item['range'], item['values'])
+            return httpx.Response(200, json={'totalUpdatedCells': len(body.get('data', []))})
+
+        a1_range = tail.lstrip('/')
+        if request.method == 'POST' and a1_range.endswith(':append'):
+            self.calls['append'] += 1
+            updated_range = self.append(a1_range[:-len(':append')], body.get('values', []))
+            return httpx.Response(200, json={'updates': {'updatedRange': updated_range}})
+        if request.method == 'PUT':
+            self.calls['update'] += 1
+            self.write(a1_range, body.get('values', []))
+            return httpx.Response(200, json={'updatedRange': a1_range})
+        if request.method == 'GET':
+            self.calls['get'] += 1
+            values = self._by_dimension(self.read(a1_range), params.get('majorDimension'))
+            return httpx.Response(200, json={'range': a1_range, 'values': values})
+        return httpx.Response(404, json={'error': {'code': 404}})
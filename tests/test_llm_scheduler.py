@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from telegram_mantra_bot.bot.llm_scheduler import LLMBusyError, LLMScheduler
+
+
+async def use_slot(scheduler, user_id):
+    async with scheduler.slot(user_id):
+        pass
+
+
+def test_second_request_of_same_user_is_rejected():
+    scheduler = LLMScheduler(max_concurrent=2)
+
+    async def scenario():
+        async with scheduler.slot(1):
+            with pytest.raises(LLMBusyError):
+                async with scheduler.slot(1):
+                    pass
+
+    asyncio.run(scenario())
+    assert scheduler.stats()['rejected_busy'] == 1
+
+
+def test_waiters_get_slots_in_arrival_order():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = []
+
+    async def job(user_id):
+        async with scheduler.slot(user_id):
+            order.append(user_id)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(job(user_id) for user_id in range(4)))
+
+    asyncio.run(scenario())
+    assert order == [0, 1, 2, 3]
+    assert scheduler.stats()['active'] == 0
+
+
+def test_cancel_during_queue_notification_releases_granted_slot():
+    scheduler = LLMScheduler(max_concurrent=1)
+
+    async def scenario():
+        holder_entered, notifying = asyncio.Event(), asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(1):
+                holder_entered.set()
+                await release.wait()
+
+        async def slow_notify(position):
+            notifying.set()
+            await asyncio.sleep(10)
+
+        async def waiter():
+            async with scheduler.slot(2, on_queued=slow_notify):
+                pass
+
+        first = asyncio.create_task(holder())
+        await holder_entered.wait()
+        second = asyncio.create_task(waiter())
+        await notifying.wait()
+        # Слот передаётся ожидающему, пока тот ещё отправляет уведомление
+        release.set()
+        await first
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+
+        # Без утечки слота следующий запрос не ждёт
+        await asyncio.wait_for(use_slot(scheduler, 3), timeout=1)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['active'] == 0
+    assert stats['queue_depth'] == 0
+
+
+def test_cancel_during_notification_before_grant_leaves_no_ghost_waiter():
+    scheduler = LLMScheduler(max_concurrent=1)
+
+    async def scenario():
+        holder_entered, notifying, release = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(1):
+                holder_entered.set()
+                await release.wait()
+
+        async def slow_notify(position):
+            notifying.set()
+            await asyncio.sleep(10)
+
+        async def waiter():
+            async with scheduler.slot(2, on_queued=slow_notify):
+                pass
+
+        first = asyncio.create_task(holder())
+        await holder_entered.wait()
+        second = asyncio.create_task(waiter())
+        await notifying.wait()
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        release.set()
+        await first
+        # Без утечки слота следующий запрос не ждёт
+        await asyncio.wait_for(use_slot(scheduler, 3), timeout=1)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['active'] == 0
+    assert stats['queue_depth'] == 0
@@ -0,0 +1,51 @@
+import asyncio
+
+from tests.fake_sheets import FakeSheetsServer
+from telegram_mantra_bot.bot.sheets import DIALOGS_HEADERS, GoogleSheetsClient
+from telegram_mantra_bot.bot.sheets_http import AsyncSheetsApi
+
+
+def run_with_client(server, scenario):
+    async def main():
+        api = AsyncSheetsApi('test', transport=server.transport(), max_retries=0)
+        try:
+            return await scenario(GoogleSheetsClient(api=api))
+        finally:
+            await api.aclose()
+    return asyncio.run(main())
+
+
+def test_missing_dialogs_sheet_is_created_with_headers():
+    server = FakeSheetsServer({'Users': [['user_id']]})
+
+    async def scenario(client):
+        assert await client.ensure_dialogs_sheet()
+        assert client.save_dialog_turn(1, 's', 1, 'Вопрос', 'Ответ')
+        await client.write_queue.flush()
+
+    run_with_client(server, scenario)
+    rows = server.read('Dialogs!A1:E2')
+    assert rows[0] == DIALOGS_HEADERS[:5]
+    assert rows[1] == ['1', 's', 1, 'Вопрос', 'Ответ']
+
+
+def test_existing_dialogs_sheet_is_left_alone():
+    server = FakeSheetsServer({'Dialogs': [DIALOGS_HEADERS]})
+
+    async def scenario(client):
+        return await client.ensure_dialogs_sheet()
+
+    assert run_with_client(server, scenario)
+    assert server.calls['addSheet'] == 0
+
+
+def test_dialog_log_is_disabled_when_sheet_cannot_be_created():
+    server = FakeSheetsServer({'Users': [['user_id']]})
+    server.fail_next('addSheet', status=403)
+
+    async def scenario(client):
+        assert not await client.ensure_dialogs_sheet()
+        return client.save_dialog_turn(1, 's', 1, 'Вопрос', 'Ответ'), client.write_queue.backlog()
+
+    assert run_with_client(server, scenario) == (False, 0)
+    assert 'Dialogs' not in server.sheets
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from tests.fake_sheets import FakeSheetsServer
+from telegram_mantra_bot.bot import models
+from telegram_mantra_bot.bot.sheets import GoogleSheetsClient
+from telegram_mantra_bot.bot.sheets_export import UsersSheetExporter
+from telegram_mantra_bot.bot.sheets_http import AsyncSheetsApi
+
+USERS_HEADERS = ['user_id', 'username', 'first_name', 'last_name', 'started_at', 'last_active', 'ai_result']
+
+
+async def add_user(telegram_id: int, username: str, updated_at: datetime):
+    user = await models.get_or_create_user(telegram_id, username)
+    async with models.SessionLocal() as session:
+        await session.execute(update(models.User).where(models.User.id == user.id).values(updated_at=updated_at))
+        await session.commit()
+
+
+def test_late_commit_behind_watermark_is_exported_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'engine', None)
+    monkeypatch.setattr(models, '_session_factory', None)
+    models.forget_user_id()
+    server = FakeSheetsServer({'Users': [USERS_HEADERS]})
+    now = datetime(2024, 5, 1, 12, 0)
+
+    async def scenario():
+        models.init(f'sqlite+aiosqlite:///{tmp_path}/bot.db')
+        await models.init_db()
+        api = AsyncSheetsApi('test', transport=server.transport(), max_retries=0)
+        try:
+            client = GoogleSheetsClient(api=api)
+            exporter = UsersSheetExporter(client, lag=60)
+            await add_user(1, 'ann', now)
+            first = await exporter.export_once()
+            await client.write_queue.flush()
+            # Транзакция получила updated_at раньше, а закоммитилась после выгрузки
+            await add_user(2, 'bob', now - timedelta(seconds=10))
+            second = await exporter.export_once()
+            await client.write_queue.flush()
+            return first, second, exporter.stats()
+        finally:
+            await api.aclose()
+            await models.engine.dispose()
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == (1, 1)
+    assert stats['users_rescanned'] == 1
+    assert [row[:2] for row in server.read('Users!A2:B')] == [['1', 'ann'], ['2', 'bob']]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from tests.fake_sheets import FakeSheetsServer, column_index
+from telegram_mantra_bot.bot.sheets_http import AsyncSheetsApi, SheetsApiError, a1_cell, column_letter, quote_sheet_name
+
+
+def make_api(server, **kwargs):
+    return AsyncSheetsApi('test', transport=server.transport(), backoff_base=0.01, **kwargs)
+
+
+@pytest.mark.parametrize('index, letters', [
+    (0, 'A'), (25, 'Z'), (26, 'AA'), (51, 'AZ'), (52, 'BA'),
+    (701, 'ZZ'), (702, 'AAA'), (18277, 'ZZZ'), (18278, 'AAAA'),
+])
+def test_column_letter(index, letters):
+    assert column_letter(index) == letters
+
+
+def test_column_letter_round_trip():
+    for index in range(20000):
+        assert column_index(column_letter(index)) == index
+
+
+def test_column_letter_negative():
+    with pytest.raises(ValueError):
+        column_letter(-1)
+
+
+def test_a1_cell_quotes_sheet_name():
+    assert a1_cell('Users', 27, 12) == 'Users!AB12'
+    assert quote_sheet_name("Daily log") == "'Daily log'"
+    assert quote_sheet_name("O'Brien") == "'O''Brien'"
+
+
+def test_retries_rate_limited_request():
+    server = FakeSheetsServer({'Users': [['id'], ['1']]})
+    server.fail_next('get', status=429, times=2)
+
+    async def scenario():
+        api = make_api(server, max_retries=2)
+        try:
+            return await api.values_get('Users!A1:A2'), api.stats()
+        finally:
+            await api.aclose()
+
+    response, stats = asyncio.run(scenario())
+    assert response['values'] == [['id'], ['1']]
+    assert stats['rate_limited'] == 2
+    assert stats['retries'] == 2
+    assert stats['failed'] == 0
+
+
+def test_gives_up_after_max_retries():
+    server = FakeSheetsServer()
+    server.fail_next('append', status=429, times=3)
+
+    async def scenario():
+        api = make_api(server, max_retries=1)
+        try:
+            with pytest.raises(SheetsApiError) as error:
+                await api.values_append('Users!A:B', [['1', 'x']])
+            return error.value, api.stats()
+        finally:
+            await api.aclose()
+
+    error, stats = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert stats['retries'] == 1
+    assert stats['failed'] == 1
+    assert 'Users' not in server.sheets
+
+
+def test_client_error_is_not_retried():
+    server = FakeSheetsServer()
+    server.fail_next('update', status=400)
+
+    async def scenario():
+        api = make_api(server, max_retries=2)
+        try:
+            with pytest.raises(SheetsApiError):
+                await api.values_update('Users!A1', [['x']])
+            return api.stats()
+        finally:
+            await api.aclose()
+
+    stats = asyncio.run(scenario())
+    assert stats['retries'] == 0
+    assert stats['calls'] == 1
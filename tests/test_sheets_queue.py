@@ -0,0 +1,146 @@
+import asyncio
+
+from tests.fake_sheets import FakeSheetsServer
+from telegram_mantra_bot.bot.ratelimit import PRIORITY_HIGH, PRIORITY_LOW
+from telegram_mantra_bot.bot.sheets_http import AsyncSheetsApi
+from telegram_mantra_bot.bot.sheets_queue import SheetsWriteQueue
+
+
+def run_with_queue(server, scenario, **kwargs):
+    """Запускает ``scenario(queue)`` с очередью поверх поддельного API без повторов"""
+    async def main():
+        api = AsyncSheetsApi('test', transport=server.transport(), max_retries=0)
+        try:
+            return await scenario(SheetsWriteQueue(api, **kwargs))
+        finally:
+            await api.aclose()
+    return asyncio.run(main())
+
+
+def test_flush_batches_cells_and_rows():
+    server = FakeSheetsServer({'Users': [['user_id', 'name', 'last_active'], ['1', 'Ann', '']]})
+    appended = {}
+
+    async def scenario(queue):
+        queue.on_row_appended = lambda key, row_num: appended.__setitem__(key, row_num)
+        queue.set_cell('Users!C2', 'monday')
+        queue.set_cell('Users!C2', 'tuesday')
+        queue.append_row('2', 'Users!A:C', ['2', 'Bob', ''])
+        queue.append_row('3', 'Users!A:C', ['3', 'Eve', ''])
+        return await queue.flush(), queue.stats()
+
+    written, stats = run_with_queue(server, scenario)
+    assert written == 3
+    assert server.calls == {'append': 1, 'batchUpdate': 1}
+    assert server.read('Users!A2:C4') == [['1', 'Ann', 'tuesday'], ['2', 'Bob'], ['3', 'Eve']]
+    assert appended == {'2': 3, '3': 4}
+    assert stats['pending_cells'] == stats['pending_rows'] == 0
+
+
+def test_row_changed_in_flight_is_patched():
+    server = FakeSheetsServer({'Users': [['user_id', 'name']]})
+
+    async def scenario(queue):
+        queue.append_row('1', 'Users!A:B', ['1', ''])
+        row = queue.pending_row('1')
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0)
+        # Строка уже отправлена, но ещё доступна для правки
+        row[1] = 'Ann'
+        await flush
+        await queue.flush()
+
+    server.latency = 0.01
+    run_with_queue(server, scenario)
+    assert server.read('Users!A2:B2') == [['1', 'Ann']]
+
+
+def test_failed_append_is_requeued_and_cells_still_written():
+    server = FakeSheetsServer({'Users': [['user_id', 'name'], ['1', '']]})
+
+    async def scenario(queue):
+        queue.set_cell('Users!B2', 'Ann')
+        queue.append_row('5', 'Users!A:B', ['5', 'Kim'])
+        server.fail_next('append', status=503)
+        written = await queue.flush()
+        stats = queue.stats()
+        return written, stats, await queue.flush()
+
+    written, stats, written_again = run_with_queue(server, scenario)
+    assert written == 1
+    assert stats['flush_errors'] == 1
+    assert stats['pending_rows'] == 1
+    assert stats['pending_cells'] == 0
+    assert written_again == 1
+    assert server.read('Users!A2:B3') == [['1', 'Ann'], ['5', 'Kim']]
+
+
+def test_failed_cells_are_requeued_without_overwriting_newer_values():
+    server = FakeSheetsServer(latency=0.01)
+
+    async def scenario(queue):
+        queue.set_cell('Users!B2', 'old')
+        server.fail_next('batchUpdate', status=503)
+        flush = asyncio.create_task(queue.flush())
+        await asyncio.sleep(0)
+        queue.set_cell('Users!B2', 'new')
+        assert await flush == 0
+        return await queue.flush()
+
+    assert run_with_queue(server, scenario) == 1
+    assert server.read('Users!B2') == [['new']]
+
+
+def test_rejected_range_does_not_block_other_writes():
+    server = FakeSheetsServer({'Users': [['user_id', 'name'], ['1', '']]})
+
+    async def scenario(queue):
+        queue.append_row('dialog:s:1', 'Dialogs!A1:F', ['1', 's', 1, 'q', 'a', ''])
+        queue.append_row('2', 'Users!A:B', ['2', 'Bob'])
+        queue.set_cell('Users!B2', 'Ann')
+        # Листа нет — Sheets отвечает 400 на первое добавление
+        server.fail_next('append', status=400)
+        written = await queue.flush()
+        return written, queue.stats(), await queue.flush()
+
+    written, stats, written_again = run_with_queue(server, scenario)
+    assert written == 2
+    assert stats['dropped_rows'] == 1
+    assert stats['pending_rows'] == stats['pending_cells'] == 0
+    assert written_again == 0
+    assert server.read('Users!A2:B3') == [['1', 'Ann'], ['2', 'Bob']]
+
+
+def test_priority_cells_go_first_when_backlog_exceeds_batch():
+    server = FakeSheetsServer()
+
+    async def scenario(queue):
+        for row in range(1, 4):
+            queue.set_cell(f'Users!C{row}', 'seen', priority=PRIORITY_LOW)
+        queue.set_cell('Users!D1', 'mantra', priority=PRIORITY_HIGH)
+        await queue.flush()
+        return queue.stats()
+
+    stats = run_with_queue(server, scenario, max_batch=2)
+    assert server.read('Users!D1') == [['mantra']]
+    assert stats['pending_cells'] == 2
+
+
+def test_rows_appended_before_a_failed_batch_update_are_not_repeated():
+    server = FakeSheetsServer({'Users': [['user_id', 'name']]})
+
+    async def scenario(queue):
+        queue.set_cell('Users!B1', 'name')
+        queue.append_row('7', 'Users!A:B', ['7', 'Lea'])
+        server.fail_next('batchUpdate', status=503)
+        assert await queue.flush() == 1
+        stats = queue.stats()
+        await queue.flush()
+        return stats
+
+    stats = run_with_queue(server, scenario)
+    # Строка уже в таблице — в очередь возвращается только ячейка
+    assert stats['pending_rows'] == 0
+    assert stats['pending_cells'] == 1
+    assert server.calls['append'] == 1
+    assert server.read('Users!A:B') == [['user_id', 'name'], ['7', 'Lea']]